@@ -0,0 +1,122 @@
+"""Sidecar index of record hashes, for emitting only new or changed records."""
+
+import hashlib
+import json
+import sqlite3
+from typing import Dict
+
+
+def record_hash(record: dict) -> bytes:
+    """Return a compact hash of the canonical JSON form of `record`."""
+    canonical = json.dumps(
+        record, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+
+class ChangeIndex:
+    """SQLite store of record key -> hash, per stream and partition.
+
+    The index for a partition is loaded once before it syncs. Its new hashes are
+    staged once it finished and only committed by `commit`, after the records
+    they cover were written out, so an interrupted sync re-emits its records on
+    the next run instead of losing them. Staged hashes live in temporary tables
+    of this connection and are discarded when it closes without a commit.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS record_hashes (
+                stream TEXT NOT NULL,
+                partition TEXT NOT NULL,
+                key TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                PRIMARY KEY (stream, partition, key)
+            ) WITHOUT ROWID
+            """
+        )
+        self._connection.execute(
+            """
+            CREATE TEMP TABLE staged_partitions (
+                stream TEXT NOT NULL,
+                partition TEXT NOT NULL,
+                PRIMARY KEY (stream, partition)
+            )
+            """
+        )
+        self._connection.execute(
+            """
+            CREATE TEMP TABLE staged_hashes (
+                stream TEXT NOT NULL,
+                partition TEXT NOT NULL,
+                key TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                PRIMARY KEY (stream, partition, key)
+            )
+            """
+        )
+
+    def load(self, stream: str, partition: str) -> Dict[str, bytes]:
+        """Return the key -> hash index stored for a stream partition."""
+        rows = self._connection.execute(
+            "SELECT key, hash FROM record_hashes WHERE stream = ? AND partition = ?",
+            (stream, partition),
+        )
+        return dict(rows)
+
+    def replace(self, stream: str, partition: str, hashes: Dict[str, bytes]) -> None:
+        """Replace the index stored for a stream partition."""
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM record_hashes WHERE stream = ? AND partition = ?",
+                (stream, partition),
+            )
+            self._connection.executemany(
+                "INSERT INTO record_hashes (stream, partition, key, hash) "
+                "VALUES (?, ?, ?, ?)",
+                [(stream, partition, key, value) for key, value in hashes.items()],
+            )
+
+    def stage(self, stream: str, partition: str, hashes: Dict[str, bytes]) -> None:
+        """Stage the index of a stream partition to replace the stored one."""
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM staged_hashes WHERE stream = ? AND partition = ?",
+                (stream, partition),
+            )
+            self._connection.execute(
+                "INSERT OR IGNORE INTO staged_partitions (stream, partition) "
+                "VALUES (?, ?)",
+                (stream, partition),
+            )
+            self._connection.executemany(
+                "INSERT INTO staged_hashes (stream, partition, key, hash) "
+                "VALUES (?, ?, ?, ?)",
+                [(stream, partition, key, value) for key, value in hashes.items()],
+            )
+
+    def commit(self) -> None:
+        """Replace the stored index of all staged partitions in one transaction."""
+        with self._connection:
+            self._connection.execute(
+                """
+                DELETE FROM record_hashes WHERE EXISTS (
+                    SELECT 1 FROM staged_partitions AS staged
+                    WHERE staged.stream = record_hashes.stream
+                    AND staged.partition = record_hashes.partition
+                )
+                """
+            )
+            self._connection.execute(
+                "INSERT INTO record_hashes (stream, partition, key, hash) "
+                "SELECT stream, partition, key, hash FROM staged_hashes"
+            )
+            self._connection.execute("DELETE FROM staged_hashes")
+            self._connection.execute("DELETE FROM staged_partitions")
+
+    def close(self) -> None:
+        """Close the connection to the index file."""
+        self._connection.close()
@@ -1,17 +1,111 @@
 """GraphQL client handling, including sparkthinkStream base class."""
 
+import abc
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
 import requests
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import Any, Dict, Optional, Union, List, Iterable, cast
+from typing import Any, Callable, Dict, Optional, Union, List, Iterable, Iterator, Set, cast
 
+from singer_sdk import metrics
+from singer_sdk import typing as th
 from singer_sdk.streams import GraphQLStream
+from singer_sdk.helpers._catalog import pop_deselected_record_properties
+from singer_sdk.helpers._util import utc_now
 from singer_sdk.helpers.jsonpath import extract_jsonpath
 
 from tap_sparkthink.auth import sparkthinkAuthenticator
+from tap_sparkthink.changes import record_hash
+
+GRAPHQL_STRING = re.compile(r'("""[\s\S]*?"""|"(?:\\.|[^"\\])*")')
+GRAPHQL_COMMENT = re.compile(r"#[^\n]*")
+GRAPHQL_SEPARATORS = re.compile(r"[\s,]+")  # commas are insignificant in GraphQL
+GRAPHQL_PUNCTUATOR_SPACE = re.compile(r" ?([{}()\[\]:=!$@]) ?")
+
+# sha256 -> minified document, for resending documents unknown to the server
+PERSISTED_QUERY_DOCUMENTS: Dict[str, str] = {}
+
+
+def compact_state(state: dict) -> dict:
+    """Return `state` without partitions and streams that hold no bookmarks.
+
+    Partitions only carrying their `context` (and null markers such as the
+    `starting_replication_value` of full-table streams) have nothing to resume
+    from, so dropping them keeps STATE messages small with thousands of projects.
+    """
+    bookmarks = {}
+    for stream_name, stream_state in state.get("bookmarks", {}).items():
+        compacted = {
+            key: value for key, value in stream_state.items() if key != "partitions"
+        }
+        partitions = [
+            partition for partition in stream_state.get("partitions", [])
+            if any(
+                value is not None
+                for key, value in partition.items()
+                if key != "context"
+            )
+        ]
+        if partitions:
+            compacted["partitions"] = partitions
+        if compacted:
+            bookmarks[stream_name] = compacted
+    return {**state, "bookmarks": bookmarks}
+
+
+@lru_cache(maxsize=None)
+def minify_query(query: str) -> str:
+    """Return `query` without comments and insignificant whitespace.
+
+    Results are cached, so each distinct query document is minified once.
+    """
+    parts = GRAPHQL_STRING.split(query)
+    for index in range(0, len(parts), 2):  # odd indexes are string literals
+        part = GRAPHQL_COMMENT.sub("", parts[index])
+        part = GRAPHQL_SEPARATORS.sub(" ", part)
+        parts[index] = GRAPHQL_PUNCTUATOR_SPACE.sub(r"\1", part)
+    return "".join(parts).strip()
+
+
+def is_sampled_project(project_id: str, fraction: float) -> bool:
+    """Return True if `project_id` is in the deterministic sample of `fraction`.
+
+    Projects are chosen by hash, so every run and stream samples the same ones.
+    """
+    digest = hashlib.blake2b(project_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") < fraction * 2**64
+
+
+@lru_cache(maxsize=None)
+def persisted_query_hash(document: str) -> str:
+    """Return the automatic persisted query hash of a minified document."""
+    digest = hashlib.sha256(document.encode("utf-8")).hexdigest()
+    PERSISTED_QUERY_DOCUMENTS[digest] = document
+    return digest
+
 
 class sparkthinkStream(GraphQLStream):
     """sparkthink stream class."""
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._schema_written = False
+        self._sampled_records = 0
+        self._latencies: deque = deque(maxlen=1000)
+        self._hedge_counts = {"requests": 0, "sent": 0, "won": 0}
+        self._hedge_lock = threading.Lock()
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._hedge_futures: Set[Future] = set()
+        if self.config.get("state_message_record_count"):
+            self.STATE_MSG_FREQUENCY = int(self.config["state_message_record_count"])
+
     @property
     def url_base(self) -> str:
         """Return the API URL root, configurable via tap settings."""
@@ -42,6 +136,404 @@ class sparkthinkStream(GraphQLStream):
         """Return the response_default_batch_size."""
         return 100
 
+    @property
+    def prefetch_depth(self) -> int:
+        """Return how many pages may be fetched ahead of the page being emitted."""
+        return int(self.config.get("pagination_prefetch_depth") or 0)
+
+    @property
+    def timeout(self) -> int:
+        """Return the request timeout in seconds, per stream if configured."""
+        timeouts = self.config.get("stream_request_timeouts") or {}
+        return (
+            timeouts.get(self.name)
+            or self.config.get("request_timeout")
+            or super().timeout
+        )
+
+    @property
+    def is_sampling(self) -> bool:
+        """Return True if any `sample_*` limit is configured."""
+        return any(
+            self.config.get(key) is not None
+            for key in (
+                "sample_project_fraction",
+                "sample_max_pages",
+                "sample_max_records_per_project",
+                "sample_max_records_per_stream",
+            )
+        )
+
+    def _send(self, prepared_request: requests.PreparedRequest) -> requests.Response:
+        """Send a prepared request through the tap's configured HTTP transport."""
+        transport = self._tap.http_transport
+        if transport is not None:
+            return transport.send(prepared_request, timeout=self.timeout)
+        return self.requests_session.send(
+            prepared_request,
+            timeout=self.timeout,
+            allow_redirects=self.allow_redirects,
+        )
+
+    def prepare_request_payload(
+        self, context: Optional[dict], next_page_token: Optional[Any]
+    ) -> Optional[dict]:
+        """Prepare the GraphQL payload from the minified query document.
+
+        With `persisted_queries` enabled only the document hash is sent; the full
+        text follows if the server does not know the hash yet (see `_request`).
+        """
+        return self.graphql_payload(
+            self.query, self.get_url_params(context, next_page_token)
+        )
+
+    def graphql_payload(self, query: str, variables: Optional[dict]) -> dict:
+        """Return the request payload for a query document and its variables."""
+        document = minify_query(query)
+        payload: Dict[str, Any] = {"query": document, "variables": variables}
+        if self.config.get("persisted_queries"):
+            payload.pop("query")
+            payload["extensions"] = {
+                "persistedQuery": {
+                    "version": 1,
+                    "sha256Hash": persisted_query_hash(document),
+                }
+            }
+        return payload
+
+    @staticmethod
+    def is_persisted_query_miss(response: requests.Response) -> bool:
+        """Return True if the server could not resolve a persisted query hash."""
+        try:
+            errors = response.json().get("errors") or []
+        except ValueError:
+            return False
+        return any(
+            "PersistedQueryNotFound" in (error.get("message") or "")
+            or (error.get("extensions") or {}).get("code") == "PERSISTED_QUERY_NOT_FOUND"
+            for error in errors
+        )
+
+    @staticmethod
+    def with_query_document(
+        prepared_request: requests.PreparedRequest,
+    ) -> requests.PreparedRequest:
+        """Return a copy of a hash-only request that also carries the document."""
+        payload = json.loads(prepared_request.body)
+        digest = payload["extensions"]["persistedQuery"]["sha256Hash"]
+        payload["query"] = PERSISTED_QUERY_DOCUMENTS[digest]
+        retry = prepared_request.copy()
+        retry.prepare_body(data=None, files=None, json=payload)
+        return retry
+
+    def hedge_threshold(self) -> Optional[float]:
+        """Return the latency after which a request is hedged, if one is due.
+
+        None when hedging is disabled, too few latencies were measured yet, or
+        the share of extra requests reached `hedge_max_ratio`.
+        """
+        percentile = self.config.get("hedge_latency_percentile")
+        min_samples = self.config.get("hedge_min_samples") or 20
+        max_ratio = self.config.get("hedge_max_ratio") or 0.05
+        with self._hedge_lock:
+            if not percentile or len(self._latencies) < min_samples:
+                return None
+            if self._hedge_counts["sent"] >= max_ratio * self._hedge_counts["requests"]:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def send_hedged(self, prepared_request: requests.PreparedRequest) -> requests.Response:
+        """Send a request, duplicating it if it is slower than the hedge threshold.
+
+        Whichever of the two requests succeeds first is used.
+        """
+        started = time.monotonic()
+        threshold = self.hedge_threshold()
+        with self._hedge_lock:
+            self._hedge_counts["requests"] += 1
+
+        if threshold is None:
+            response = self._send(prepared_request)
+        else:
+            primary = self.submit_hedged(prepared_request)
+            done, _ = wait([primary], timeout=threshold)
+            if done:
+                response = primary.result()
+            else:
+                hedge = self.submit_hedged(prepared_request.copy())
+                with self._hedge_lock:
+                    self._hedge_counts["sent"] += 1
+                winner = self.first_successful([primary, hedge])
+                for future in (primary, hedge):
+                    if future is not winner:
+                        future.cancel()  # only has an effect if it hasn't started yet
+                if winner is hedge:
+                    with self._hedge_lock:
+                        self._hedge_counts["won"] += 1
+                response = winner.result()
+
+        with self._hedge_lock:
+            self._latencies.append(time.monotonic() - started)
+        return response
+
+    def submit_hedged(self, prepared_request: requests.PreparedRequest) -> Future:
+        """Send a request on the hedging threads, tracking it until it is done."""
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix=f"{self.name}-hedge"
+            )
+        future = self._hedge_executor.submit(self._send, prepared_request)
+        with self._hedge_lock:
+            self._hedge_futures.add(future)
+        future.add_done_callback(self._discard_hedge_future)
+        return future
+
+    def _discard_hedge_future(self, future: Future) -> None:
+        with self._hedge_lock:
+            self._hedge_futures.discard(future)
+
+    @staticmethod
+    def first_successful(futures: List[Future]) -> Future:
+        """Wait for the first of `futures` to succeed.
+
+        Returns the first future to fail if all of them fail.
+        """
+        pending = set(futures)
+        failed: List[Future] = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future
+                failed.append(future)
+        return failed[0]
+
+    def close_hedging(self) -> None:
+        """Stop the hedged request threads, dropping requests not started yet."""
+        if self._hedge_executor is not None:
+            with self._hedge_lock:
+                futures = list(self._hedge_futures)
+            for future in futures:
+                future.cancel()  # `shutdown(cancel_futures=True)` needs Python 3.9
+            self._hedge_executor.shutdown(wait=False)
+            self._hedge_executor = None
+
+    def log_sync_costs(self) -> None:
+        """Log sync costs, and hedged request counters if any hedges were sent."""
+        super().log_sync_costs()
+        if self._hedge_counts["sent"]:
+            self.logger.info(
+                "Hedged %d of %d requests for stream '%s', %d hedges won.",
+                self._hedge_counts["sent"],
+                self._hedge_counts["requests"],
+                self.name,
+                self._hedge_counts["won"],
+            )
+
+    def _request(
+        self, prepared_request: requests.PreparedRequest, context: Optional[dict]
+    ) -> requests.Response:
+        """Send a request, log its duration and validate the response."""
+        response = self.send_hedged(prepared_request)
+        if self.config.get("persisted_queries") and self.is_persisted_query_miss(response):
+            # register the document with the server, later requests send the hash only
+            response = self._send(self.with_query_document(prepared_request))
+        self._write_request_duration_log(
+            endpoint=self.path,
+            response=response,
+            context=context,
+            extra_tags={"url": prepared_request.path_url}
+            if self._LOG_REQUEST_METRIC_URLS
+            else None,
+        )
+        self.validate_response(response)
+        return response
+
+    def prepare_query_request(
+        self, query: str, context: Optional[dict], next_page_token: Optional[Any]
+    ) -> requests.PreparedRequest:
+        """Prepare a request like `prepare_request`, for another query document."""
+        params = self.get_url_params(context, next_page_token)
+        return self.build_prepared_request(
+            method=self.rest_method,
+            url=self.get_url(context),
+            params=params,
+            headers=self.http_headers,
+            json=self.graphql_payload(query, params),
+        )
+
+    def request_query(
+        self, query: str, context: Optional[dict], recover: bool = True
+    ) -> requests.Response:
+        """Send a single, unpaginated request for another query document.
+
+        GraphQL errors are handled like those of paginated requests (see
+        `recover_page`), unless `recover` is False.
+        """
+        request = self.request_decorator(self._request)
+        prepared_request = self.prepare_query_request(query, context, None)
+        response = request(prepared_request, context)
+        self.update_sync_costs(prepared_request, response, context)
+        if recover and self.graphql_errors(response):
+            response = self.recover_page(request, response, context, None, query)
+        return response
+
+    def request_pages(self, context: Optional[dict]) -> Iterator[requests.Response]:
+        """Request the pages of `context` one after another, following the cursor."""
+        paginator = self.get_new_paginator()
+        decorated_request = self.request_decorator(self._request)
+        max_pages = self.config.get("sample_max_pages")
+        pages = 0
+
+        while not paginator.finished:
+            if max_pages and pages >= max_pages:
+                self.logger.info(
+                    "Sampling stopped pagination after %d pages for context %s.",
+                    pages,
+                    context,
+                )
+                break
+            pages += 1
+            prepared_request = self.prepare_request(
+                context, next_page_token=paginator.current_value
+            )
+            response = decorated_request(prepared_request, context)
+            self.update_sync_costs(prepared_request, response, context)
+            if self.graphql_errors(response):
+                response = self.recover_page(
+                    decorated_request,
+                    response,
+                    context,
+                    paginator.current_value,
+                    self.query,
+                )
+            yield response
+            paginator.advance(response)
+
+    @staticmethod
+    def graphql_errors(response: requests.Response) -> List[dict]:
+        """Return the GraphQL errors of a response, if any."""
+        try:
+            return response.json().get("errors") or []
+        except ValueError:
+            return []
+
+    def recover_page(
+        self,
+        request: Callable[[requests.PreparedRequest, Optional[dict]], requests.Response],
+        response: requests.Response,
+        context: Optional[dict],
+        next_page_token: Optional[Any],
+        query: str,
+    ) -> requests.Response:
+        """Retry a page of `query` whose response has GraphQL errors.
+
+        The page is requested again as is and, if that fails too, with half of the
+        `response_batch_size`, to get past a record the server fails on. When all
+        attempts fail, the partial data of the first response is kept and the
+        project is flagged as incomplete for all streams (see `filter_changes`).
+        """
+        attempts = [context]
+        batch_size = (context or {}).get("response_batch_size")
+        if batch_size and batch_size > 1 and "$response_batch_size" in query:
+            attempts.append({**context, "response_batch_size": batch_size // 2})
+
+        for attempt_context in attempts:
+            self.logger.warning(
+                "Retrying page for context %s after GraphQL errors: %s",
+                attempt_context,
+                self.graphql_errors(response),
+            )
+            prepared_request = self.prepare_query_request(
+                query, attempt_context, next_page_token
+            )
+            retry = request(prepared_request, attempt_context)
+            self.update_sync_costs(prepared_request, retry, attempt_context)
+            if not self.graphql_errors(retry):
+                return retry
+
+        self.logger.error(
+            "Keeping the partial data of a page with GraphQL errors for context %s.",
+            context,
+        )
+        if context and "project_id" in context:
+            self._tap.incomplete_projects.add(context["project_id"])
+        return response
+
+    def prefetch_pages(
+        self, pages: Iterator[requests.Response], depth: int
+    ) -> Iterator[requests.Response]:
+        """Iterate `pages` in a background thread, up to `depth` pages ahead.
+
+        The next page is requested as soon as the cursor of the previous one is
+        known, while the caller is still parsing and emitting its records.
+        """
+        buffer: queue.Queue = queue.Queue(maxsize=depth)
+        stopped = threading.Event()
+
+        def put(item: tuple) -> bool:
+            while not stopped.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce() -> None:
+            try:
+                for page in pages:
+                    if not put(("page", page)):
+                        return
+                put(("done", None))
+            except Exception as ex:
+                put(("error", ex))
+            finally:
+                pages.close()
+
+        producer = threading.Thread(
+            target=produce, name=f"{self.name}-prefetch", daemon=True
+        )
+        producer.start()
+        try:
+            while True:
+                kind, item = buffer.get()
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            producer.join()
+
+    def request_records(self, context: Optional[dict]) -> Iterable[dict]:
+        """Request records page by page, prefetching pages if configured."""
+        pages = self.request_pages(context)
+        if self.prefetch_depth:
+            pages = self.prefetch_pages(pages, self.prefetch_depth)
+
+        with metrics.http_request_counter(self.name, self.path) as request_counter:
+            request_counter.context = context
+            try:
+                for page, response in enumerate(pages):
+                    request_counter.increment()
+                    records = iter(self.parse_response(response))
+                    try:
+                        first_record = next(records)
+                    except StopIteration:
+                        self.logger.info(
+                            "Pagination stopped after %d pages because no records "
+                            "were found in the last response",
+                            page,
+                        )
+                        break
+                    yield first_record
+                    yield from records
+            finally:
+                pages.close()
+
     def parse_response(self, response: requests.Response) -> Iterable[dict]:
         """Parse the response and return an iterator of result rows."""
         if response.json().get("errors"):
@@ -51,20 +543,161 @@ class sparkthinkStream(GraphQLStream):
 
         yield from extract_jsonpath(self.records_jsonpath, input=response.json())
 
+    def _write_state_message(self) -> None:
+        """Write the tap's compacted state, if the tap's emission policy allows."""
+        if not self._is_state_flushed and self._tap.write_state_message():
+            self._is_state_flushed = True
+
+    def _write_schema_message(self) -> None:
+        """Write the SCHEMA message, once per run even if synced per partition."""
+        if not self._schema_written:
+            super()._write_schema_message()
+            self._schema_written = True
+
+    def write_schema_once(self) -> None:
+        """Write the SCHEMA message for records written on behalf of another stream."""
+        self._write_schema_message()
+
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        """Return records, feeding any selected unnested child streams in-line."""
+        unnested = [
+            stream for stream in self.child_streams
+            if isinstance(stream, UnnestedStream) and stream.selected
+        ]
+        for stream in unnested:
+            stream.write_schema_once()
+
+        limit = self.sample_record_limit(context)
+        if limit == 0:
+            return
+        records = super().get_records(context)
+        try:
+            for count, record in enumerate(records, start=1):
+                for stream in unnested:
+                    stream.write_child_records(record)
+                self._sampled_records += 1
+                yield record
+                if count == limit:
+                    self.logger.info(
+                        "Sampling stopped the stream after %d records for context %s.",
+                        count,
+                        context,
+                    )
+                    break
+        finally:
+            # stops pagination (and any page prefetching) of the partition
+            records.close()
+
+    def sample_record_limit(self, context: Optional[dict]) -> Optional[int]:
+        """Return how many more records to sync for `context` in sampling mode.
+
+        None if no record limit is configured.
+        """
+        limits = []
+        per_stream = self.config.get("sample_max_records_per_stream")
+        if per_stream is not None:
+            limits.append(max(per_stream - self._sampled_records, 0))
+        per_project = self.config.get("sample_max_records_per_project")
+        if per_project is not None and context and "project_id" in context:
+            limits.append(per_project)
+        return min(limits) if limits else None
+
+    def generate_child_contexts(
+        self, record: dict, context: Optional[dict]
+    ) -> Iterable[Optional[dict]]:
+        """Skip per-record child syncs for children fed from `get_records`."""
+        if all(isinstance(stream, UnnestedStream) for stream in self.child_streams):
+            return
+        yield from super().generate_child_contexts(record, context)
+
+
+class UnnestedStream(sparkthinkStream):
+    """Base class for streams unnested from the records of a parent stream.
+
+    Rows are produced from pages the parent has already fetched, so these
+    streams never issue API requests of their own.
+    """
+    selected_by_default = False
+    state_partitioning_keys: List[str] = []
+
+    @abc.abstractmethod
+    def get_child_records(self, record: dict) -> Iterable[dict]:
+        """Return the flattened rows contained in a parent record."""
+
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        """Return nothing, rows are written while the parent stream syncs."""
+        return []
+
+    def write_child_records(self, record: dict) -> None:
+        """Write a RECORD message for every row unnested from `record`."""
+        for row in self.get_child_records(record):
+            self._write_record_message(row)
+
+
 class ProjectBasedStream(sparkthinkStream):
     """Base class for streams that are keyed based on project ID."""
+
+    #: Fields requested inside `project(...)`, for streams that can share one
+    #: project query per project when `combined_project_fetch` is enabled.
+    project_selection: Optional[str] = None
+
+    # keep the batch size out of state and records, partitions are per project
+    state_partitioning_keys = ["project_id"]
+
+    #: Whether only new or changed records are emitted when the tap has a
+    #: `change_detection_path`. Meant for streams without a replication key.
+    change_detection = False
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        if (
+            self.change_detection
+            and self.config.get("change_detection_path")
+            and self.config.get("change_detection_tombstones")
+        ):
+            self.schema = {
+                **self.schema,
+                "properties": {
+                    **self.schema["properties"],
+                    **th.Property("_sdc_deleted_at", th.DateTimeType).to_dict(),
+                },
+            }
+
     @property
+    def project_ids(self) -> List[str]:
+        """Return the project IDs configured in `project_ids`.
+
+        With `sample_project_fraction` only a deterministic sample of them is
+        returned.
+        """
+        project_ids = [ x.strip() for x in self.config.get("project_ids").strip('[]').split(',') ]
+        fraction = self.config.get("sample_project_fraction")
+        if fraction is not None:
+            project_ids = [
+                project_id for project_id in project_ids
+                if is_sampled_project(project_id, fraction)
+            ]
+        return project_ids
+
+    @cached_property
     def partitions(self) -> List[dict]:
-        """Return a list of partition key dicts (if applicable), otherwise None."""
-        
+        """Return a list of partition key dicts (if applicable), otherwise None.
+
+        Built once per run, so projects are ordered by the costs recorded in the
+        state the run started from.
+        """
         if "project" in self.records_jsonpath:
-            return [
+            partitions = [
                 {
                     "project_id": id,
                     "response_batch_size": self.response_batch_size or self.response_default_batch_size
                 } 
-                for id in [ x.strip() for x in self.config.get("project_ids").strip('[]').split(',') ]
+                for id in self.project_ids
             ]
+            if self.config.get("schedule_largest_projects_first"):
+                # projects without recorded stats go first, their cost is unknown
+                partitions.sort(key=lambda partition: -self.estimated_cost(partition))
+            return partitions
 
         raise ValueError(
             "Could not detect partition type for stream "
@@ -87,11 +720,133 @@ class ProjectBasedStream(sparkthinkStream):
         
         return params
 
-    def post_process(self, row: dict, context: Optional[dict] = None) -> dict:
+    def estimated_seconds(self, context: dict) -> Optional[float]:
+        """Return how long the last sync of this project took, if recorded in state."""
+        stats = self.get_context_state(context).get("sync_stats")
+        return stats["seconds"] if stats else None
+
+    def estimated_cost(self, context: dict) -> float:
+        """Return the estimated seconds to sync a project, infinite if unknown."""
+        seconds = self.estimated_seconds(context)
+        return float("inf") if seconds is None else seconds
+
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        """Return the records of a project, skipping unchanged ones if enabled.
+
+        With `schedule_largest_projects_first`, the record count and duration of
+        the project are kept in its partition state, for scheduling the next run.
+        Sampling runs don't store them, their counts are truncated.
+        """
+        estimate = self.estimated_seconds(context)
+        started = time.monotonic()
+        count = 0
+        for record in self.filter_changes(super().get_records(context), context):
+            count += 1
+            yield record
+
+        seconds = round(time.monotonic() - started, 3)
+        if self.config.get("schedule_largest_projects_first") and not self.is_sampling:
+            self.get_context_state(context)["sync_stats"] = {
+                "records": count,
+                "seconds": seconds,
+            }
+        self.logger.info(
+            "Synced %d records for project_id '%s' in %.1fs (estimated: %s).",
+            count,
+            context["project_id"],
+            seconds,
+            "unknown" if estimate is None else f"{estimate:.1f}s",
+        )
+
+    def write_shared_records(self, project: dict, context: dict) -> None:
+        """Write this stream's records found in a project fetched by another stream.
+
+        Records are counted and limited like the ones of the stream's own sync.
+        """
+        limit = self.sample_record_limit(context)
+        if limit == 0:
+            return
+        data = {"data": {"project": project}}
+        rows = (
+            self.post_process(row, context)
+            for row in extract_jsonpath(self.records_jsonpath, input=data)
+        )
+        with metrics.record_counter(self.name) as record_counter:
+            record_counter.context = context
+            count = 0
+            for row in self.filter_changes(rows, context):
+                if not row:
+                    continue
+                self._check_max_record_limit(current_record_index=self._sampled_records)
+                self._write_record_message(row)
+                self._sampled_records += 1
+                record_counter.increment()
+                count += 1
+                if count == limit:
+                    self.logger.info(
+                        "Sampling stopped the stream after %d records for context %s.",
+                        limit,
+                        context,
+                    )
+                    break
+
+    def filter_changes(
+        self, records: Iterable[dict], context: dict
+    ) -> Iterable[Dict[str, Any]]:
+        """Drop records whose hash matches the change index of their project.
+
+        Keys missing from this run are emitted as `_sdc_deleted_at` tombstones when
+        `change_detection_tombstones` is enabled. The project's new index is only
+        staged once all of its records went through, and never in sampling mode
+        where the records of a project may be incomplete. The tap commits it
+        after the sync wrote all records.
+        """
+        index = self._tap.change_index
+        if index is None or not self.change_detection or self.is_sampling:
+            yield from records
+            return
+
+        project_id = context["project_id"]
+        previous = index.load(self.name, project_id)
+        current: Dict[str, bytes] = {}
+        unchanged = 0
+        for record in records:
+            if not record:
+                yield record
+                continue
+            # hash the record as emitted, so newly selected properties are backfilled
+            pop_deselected_record_properties(record, self.schema, self.mask)
+            key = json.dumps([record.get(name) for name in self.primary_keys])
+            current[key] = record_hash(record)
+            if previous.get(key) == current[key]:
+                unchanged += 1
+                continue
+            yield record
+
+        if project_id in self._tap.incomplete_projects:
+            # records missing from a partial page are not deleted, keep their hashes
+            index.stage(self.name, project_id, {**previous, **current})
+            return
+
+        if self.config.get("change_detection_tombstones"):
+            deleted_at = utc_now().isoformat()
+            for key in previous.keys() - current.keys():
+                yield {
+                    **dict(zip(self.primary_keys, json.loads(key))),
+                    "_sdc_deleted_at": deleted_at,
+                }
+
+        index.stage(self.name, project_id, current)
+        self.logger.info(
+            "Skipped %d unchanged of %d records for project_id '%s'.",
+            unchanged, len(current), project_id,
+        )
+
+    def post_process(self, row: dict, context: Optional[dict] = None) -> Optional[dict]:
         """As needed, append or transform raw data to match expected structure."""
         if row is None:
             self.logger.warning(f"No data for project_id '{context['project_id']}'")
-            return {} # handle bad/empty row (no data found based on given project_id)
+            return None # skip bad/empty row (no data found based on given project_id)
 
         row['project_id'] = context['project_id'] 
                  
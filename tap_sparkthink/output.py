@@ -0,0 +1,96 @@
+"""Background writer thread for Singer messages."""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional, TextIO
+
+# Put on the queue to tell the writer thread to stop.
+_STOP = object()
+
+
+class OutputWriter:
+    """Serialize and write Singer messages on a dedicated thread.
+
+    Messages pass through a bounded FIFO queue, so memory use is capped by
+    `queue_size` and a slow target only stalls fetching once the queue is full.
+    Messages are written in the order they were queued, which keeps STATE
+    messages after the records they cover. Callers must not mutate a message
+    after queueing it.
+
+    The time the fetching side spent blocked on a full queue and the time the
+    writer spent waiting on an empty one tell which side is the bottleneck.
+    """
+
+    def __init__(
+        self,
+        serialize: Callable[[Any], str],
+        output: TextIO,
+        queue_size: int = 1000,
+    ) -> None:
+        self._serialize = serialize
+        self._output = output
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self.messages = 0
+        self.producer_blocked_seconds = 0.0
+        self.writer_idle_seconds = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name="sparkthink-output", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, message: Any) -> None:
+        """Queue `message`, blocking while the queue is full.
+
+        Raises:
+            RuntimeError: If the writer thread failed.
+        """
+        if self._error is not None:
+            raise RuntimeError("Writing Singer messages failed.") from self._error
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            started = time.monotonic()
+            self._queue.put(message)
+            self.producer_blocked_seconds += time.monotonic() - started
+
+    def _run(self) -> None:
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                # nothing buffered: flush what was written and wait for more
+                if self._error is None:
+                    self._flush()
+                started = time.monotonic()
+                message = self._queue.get()
+                self.writer_idle_seconds += time.monotonic() - started
+            if message is _STOP:
+                return
+            if self._error is not None:
+                continue  # keep draining so the producer never blocks forever
+            try:
+                self._output.write(self._serialize(message) + "\n")
+                self.messages += 1
+            except BaseException as ex:  # noqa: BLE001
+                self._error = ex
+
+    def _flush(self) -> None:
+        try:
+            self._output.flush()
+        except BaseException as ex:  # noqa: BLE001
+            self._error = ex
+
+    def close(self) -> None:
+        """Write all queued messages and stop the writer thread.
+
+        Raises:
+            RuntimeError: If the writer thread failed.
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._error is None:
+            self._flush()
+        if self._error is not None:
+            raise RuntimeError("Writing Singer messages failed.") from self._error
@@ -1,11 +1,15 @@
 """Stream type classes for tap-sparkthink."""
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Optional, Union, List, Iterable
+from typing import Any, Dict, Optional, Union, List, Iterable, Tuple
 
+import requests
 from singer_sdk import typing as th  # JSON Schema typing helpers
+from singer_sdk.exceptions import FatalAPIError, RetriableAPIError
 
-from tap_sparkthink.client import ProjectBasedStream, sparkthinkStream
+from tap_sparkthink.client import ProjectBasedStream, UnnestedStream, sparkthinkStream
 
 # TODO: Delete this is if not using json files for schema definition
 SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
@@ -13,6 +17,16 @@ SCHEMAS_DIR = Path(__file__).parent / Path("./schemas")
 #       - Copy-paste as many times as needed to create multiple stream types.
 
 
+@lru_cache(maxsize=None)
+def combined_project_query(selections: Tuple[str, ...]) -> str:
+    """Return one project query requesting the union of the given selection sets."""
+    return """
+            query CombinedProjectDetails($project_id: ID!) {
+                project(id: $project_id, type: Survey) {""" + "".join(selections) + """}
+            }
+            """
+
+
 class MyProjectsStream(sparkthinkStream):
     """Define custom stream."""
     name = "my_projects"
@@ -97,12 +111,9 @@ class ProjectsListStream(sparkthinkStream):
     replication_key = None
     records_jsonpath = "$.data.projects[*]"
 
-    @property
-    def query(self) -> str:
-        return """
+    query = """
             query ProjectsList {
-                """  \
-             + "projects" + """ {
+                projects {
                     id
                     clientName
                     coverImageUrl
@@ -175,14 +186,10 @@ class ProjectStream(ProjectBasedStream):
     ).to_dict()
     primary_keys = ["project_id"]
     replication_key = None
+    change_detection = True
     records_jsonpath = "$.data.project"
 
-    @property
-    def query(self) -> str:
-        return """
-            query ProjectDetails($project_id: ID!) {
-                """  \
-             + "project(id: $project_id, type: Survey)" + """{
+    project_selection = """
                     clientName
                     coverImageUrl
                     description
@@ -209,10 +216,55 @@ class ProjectStream(ProjectBasedStream):
                     theme
                     title
                     __typename
-                }
+            """
+    project_query = """
+            query ProjectDetails($project_id: ID!) {
+                project(id: $project_id, type: Survey) {""" + project_selection + """}
             }
             """
 
+    @property
+    def shared_fetch_streams(self) -> List[ProjectBasedStream]:
+        """Return the other selected streams that can share this stream's fetch."""
+        return [
+            stream for stream in self._tap.streams.values()
+            if isinstance(stream, ProjectBasedStream)
+            and stream.project_selection
+            and stream is not self
+            and stream.selected
+        ]
+
+    @property
+    def query(self) -> str:
+        """Return the project query, combined with other streams' if enabled."""
+        if not self.config.get("combined_project_fetch"):
+            return self.project_query
+
+        streams = ([self] if self.selected else []) + self.shared_fetch_streams
+        return combined_project_query(
+            tuple(stream.project_selection for stream in streams)
+        )
+
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        """Return project records, routing shared fields to their own streams."""
+        if not self.config.get("combined_project_fetch"):
+            yield from super().get_records(context)
+            return
+
+        for stream in self.shared_fetch_streams:
+            stream.write_schema_once()
+        yield from super().get_records(context)
+
+    def post_process(self, row: dict, context: Optional[dict] = None) -> Optional[dict]:
+        """Route the fields of other streams fetched along with the project."""
+        row = super().post_process(row, context)
+        if not row or not self.config.get("combined_project_fetch"):
+            return row
+
+        for stream in self.shared_fetch_streams:
+            stream.write_shared_records(row, context)
+        properties = self.schema["properties"]
+        return {key: value for key, value in row.items() if key in properties}
 
 class TeamMembersStream(ProjectBasedStream):
     """Define custom stream."""
@@ -228,23 +280,22 @@ class TeamMembersStream(ProjectBasedStream):
     ).to_dict()
     primary_keys = ["project_id", "id"]
     replication_key = None
+    change_detection = True
     records_jsonpath = "$.data.project.teamMembers[*]"
 
-    @property
-    def query(self) -> str:
-        return """
-            query TeamMemberDetails($project_id: ID!) {
-                """  \
-            + f"project(id: $project_id, type: Survey)" + """{
+    project_selection = """
                     teamMembers{
                         id
                         name
                         email
                         role
                     }
-                }
+            """
+    query = """
+            query TeamMemberDetails($project_id: ID!) {
+                project(id: $project_id, type: Survey) {""" + project_selection + """}
             }
-            """    
+            """
 
 
 class RespondentsStream(ProjectBasedStream):
@@ -273,15 +324,13 @@ class RespondentsStream(ProjectBasedStream):
     ).to_dict()
     primary_keys = ["project_id", "userId", "collectorId"]
     replication_key = None
+    change_detection = True
     records_jsonpath = "$.data.project.respondents.edges[*].node"
     next_page_token_jsonpath = "$.data.project.respondents.edges[-1:].cursor"
 
-    @property
-    def query(self) -> str:
-        return """
+    query = """
             query RespondentDetails($project_id: ID!, $response_batch_size: Int, $cursor: String) {
-                """  \
-            + f"project(id: $project_id)" + """{
+                project(id: $project_id) {
                     respondents (first: $response_batch_size, after: $cursor) {
                         edges{
                             node{
@@ -306,6 +355,21 @@ class RespondentsStream(ProjectBasedStream):
 
 
 
+# Union field alias populated for each response `__typename`.
+RESPONSE_UNION_FIELDS = {
+    "NestedOptionResponse": "NestedOptionResponseOptions",
+    "TextResponse": "TextResponseValue",
+    "NumericResponse": "NumericResponseValue",
+    "OptionResponse": "OptionResponseValue",
+    "ListResponse": "ListResponseValue",
+}
+# Union field aliases that never apply to a given `__typename`.
+RESPONSE_SPARSE_DROP_FIELDS = {
+    typename: frozenset(RESPONSE_UNION_FIELDS.values()) - {field}
+    for typename, field in RESPONSE_UNION_FIELDS.items()
+}
+
+
 class ResponsesStream(ProjectBasedStream):
     """Define custom stream."""
     name = "responses"
@@ -376,18 +440,24 @@ class ResponsesStream(ProjectBasedStream):
             "ListResponseValue",
             th.ArrayType(th.StringType)
         ),
+        # populated only when `denormalize_question_metadata` is enabled
+        th.Property("questionType", th.StringType),
+        th.Property("questionTitle", th.StringType),
+        th.Property("questionRequired", th.BooleanType),
     ).to_dict()
     primary_keys = ["project_id", "id"]
     replication_key = None
     records_jsonpath = "$.data.project.responses.edges[*].node"
     next_page_token_jsonpath = "$.data.project.responses.edges[-1:].cursor"
 
-    @property
-    def query(self) -> str:
-        return """
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # question ID -> (__typename, title, required), per project being synced
+        self._question_index: Dict[str, Dict[str, tuple]] = {}
+
+    query = """
             query Responses($project_id: ID!, $response_batch_size: Int, $cursor: String) {
-                """  \
-            + f"project(id: $project_id)" + """{
+                project(id: $project_id) {
                     responses(first: $response_batch_size, after: $cursor) {
                                 edges {
                                     node {
@@ -444,6 +514,322 @@ class ResponsesStream(ProjectBasedStream):
                     }
                     """
 
+    def get_records(self, context: Optional[dict]) -> Iterable[Dict[str, Any]]:
+        """Return responses, building the project's question index first if enabled."""
+        if not self.config.get("denormalize_question_metadata"):
+            yield from super().get_records(context)
+            return
+
+        project_id = context["project_id"]
+        self._question_index[project_id] = self.get_question_index(context)
+        try:
+            yield from super().get_records(context)
+        finally:
+            # only keep the index around for the partition being synced
+            self._question_index.pop(project_id, None)
+
+    def get_question_index(self, context: dict) -> Dict[str, tuple]:
+        """Fetch the project's questions and index the attributes we denormalize."""
+        questions = self._tap.streams[QuestionsStream.name]
+        return {
+            question["id"]: (
+                question.get("__typename"),
+                (question.get("content") or {}).get("title"),
+                question.get("required"),
+            )
+            for question in questions.request_records(context, store_count=False)
+            if question
+        }
+
+    def post_process(self, row: dict, context: Optional[dict] = None) -> Optional[dict]:
+        """Attach indexed question attributes when denormalization is enabled."""
+        row = super().post_process(row, context)
+        index = self._question_index.get(context["project_id"]) if row else None
+        if index is not None:
+            question_type, title, required = index.get(
+                row.get("questionId"), (None, None, None)
+            )
+            row["questionType"] = question_type
+            row["questionTitle"] = title
+            row["questionRequired"] = required
+
+        if row and self.config.get("sparse_responses"):
+            for field in RESPONSE_SPARSE_DROP_FIELDS.get(row.get("__typename"), ()):
+                row.pop(field, None)
+            row = self.drop_empty_values(row)
+        return row
+
+    @classmethod
+    def drop_empty_values(cls, value: Any) -> Any:
+        """Return `value` without null properties and empty nested objects."""
+        if isinstance(value, dict):
+            compacted = {}
+            for key, item in value.items():
+                item = cls.drop_empty_values(item)
+                if item is not None and item != {}:
+                    compacted[key] = item
+            return compacted
+        if isinstance(value, list):
+            return [cls.drop_empty_values(item) for item in value]
+        return value
+
+
+class ResponseOptionValuesStream(UnnestedStream):
+    """Selected option values of `responses`, one row per value.
+
+    Flattens both `NestedOptionResponseOptions[].value[]` and
+    `OptionResponseValue[]`; `optionId`/`optionLabel` are null for the latter.
+    """
+    name = "response_option_values"
+    parent_stream_type = ResponsesStream
+    schema = th.PropertiesList(
+        th.Property("project_id", th.StringType),
+        th.Property("response_id", th.StringType),
+        th.Property("questionId", th.StringType),
+        th.Property("collectorId", th.StringType),
+        th.Property("position", th.IntegerType),
+        th.Property("optionId", th.StringType),
+        th.Property("optionLabel", th.StringType),
+        th.Property("id", th.StringType),
+        th.Property("label", th.StringType),
+        th.Property("additionalUserInput", th.StringType),
+    ).to_dict()
+    primary_keys = ["project_id", "response_id", "position"]
+    replication_key = None
+
+    def get_child_records(self, record: dict) -> Iterable[dict]:
+        values = [
+            (option, value)
+            for option in record.get("NestedOptionResponseOptions") or []
+            for value in option.get("value") or []
+        ]
+        values += [(None, value) for value in record.get("OptionResponseValue") or []]
+
+        for position, (option, value) in enumerate(values):
+            yield {
+                "project_id": record.get("project_id"),
+                "response_id": record.get("id"),
+                "questionId": record.get("questionId"),
+                "collectorId": record.get("collectorId"),
+                "position": position,
+                "optionId": option.get("id") if option else None,
+                "optionLabel": option.get("label") if option else None,
+                "id": value.get("id"),
+                "label": value.get("label"),
+                "additionalUserInput": value.get("additionalUserInput"),
+            }
+
+
+class ResponseTextValuesStream(UnnestedStream):
+    """Text inputs of `responses` (`TextResponseValue[]`), one row per input."""
+    name = "response_text_values"
+    parent_stream_type = ResponsesStream
+    schema = th.PropertiesList(
+        th.Property("project_id", th.StringType),
+        th.Property("response_id", th.StringType),
+        th.Property("questionId", th.StringType),
+        th.Property("collectorId", th.StringType),
+        th.Property("position", th.IntegerType),
+        th.Property("id", th.StringType),
+        th.Property("userInput", th.StringType),
+    ).to_dict()
+    primary_keys = ["project_id", "response_id", "position"]
+    replication_key = None
+
+    def get_child_records(self, record: dict) -> Iterable[dict]:
+        for position, value in enumerate(record.get("TextResponseValue") or []):
+            yield {
+                "project_id": record.get("project_id"),
+                "response_id": record.get("id"),
+                "questionId": record.get("questionId"),
+                "collectorId": record.get("collectorId"),
+                "position": position,
+                "id": value.get("id"),
+                "userInput": value.get("userInput"),
+            }
+
+
+# Selection sets of a survey question, which can be requested together or as
+# separate concurrent queries (see `QuestionsStream.split_queries`).
+QUESTION_CORE_FIELDS = """
+                        ... on MatrixQuestion {
+                            required
+                        }
+                        ... on MultipleChoiceQuestion {
+                            required
+                        }
+                        ... on MultipleChoiceStackQuestion {
+                            required
+                        }
+                        ... on NPSQuestion {
+                            required
+                        }
+                        ... on RankingQuestion {
+                            required
+                        }
+                        ... on RatingQuestion {
+                            required
+                        }
+                        ... on SliderQuestion {
+                            required
+                        }
+                        ... on TextEntryQuestion {
+                            required
+                        }
+                        hidden
+                        metadata {
+                            createdBy {
+                                id
+                                name
+                                email
+                            }
+                            createdUTC
+                            lastModifiedUTC
+                        }"""
+QUESTION_CONTENT_FIELDS = """
+                        content {
+                            backgroundImageUrl
+                            description
+                            title
+                            __typename
+                            ... on MatrixQuestionContent{
+                                columns {
+                                    id
+                                    hasFollowUp
+                                    followUpQuestion
+                                    label
+                                }
+                                moreInfoText
+                                rows {
+                                    id
+                                    title
+                                    description
+                                }
+                            }
+                            ... on MultipleChoiceContent {
+                                allowMultiple
+                                answers {
+                                    id
+                                    label
+                                }
+                                multipleChoiceMaxSelectionCount: maxSelectionCount
+                                moreInfoText
+                                showOther
+                            }
+                            ... on MultipleChoiceStackContent {
+                                allowMultiple
+                                answers {
+                                    id
+                                    label
+                                }
+                                multipleChoiceStackContentMaxSelectionCount: maxSelectionCount
+                                moreInfoText
+                                showOther
+                                subQuestions {
+                                    id
+                                    title
+                                    description
+                                }
+                            }
+                            ... on NPSQuestionContent {
+                                showLabels
+                                labels {
+                                    left
+                                    right
+                                }
+                            }
+                            ... on RankingQuestionContent {
+                                answers {
+                                    id
+                                    label
+                                }
+                                randomizeAnswers
+                                showOther
+                            }
+                            ... on SliderQuestionContent{
+                                labels {
+                                    left
+                                    middle
+                                    right
+                                }
+                                showLabels
+                                steps
+                            }
+                            ... on TextEntryQuestionContent{
+                                inputs
+                                placeholderText {
+                                    id
+                                    label
+                                }
+                            }
+                        }"""
+QUESTION_LOGIC_FIELDS = """
+                        logic {
+                            preLogicRules {
+                                logicRuleId
+                                action {
+                                    contextItemId
+                                    contextItemType
+                                    targetItemId
+                                    targetItemType
+                                    verb
+                                }
+                                condition {
+                                    compareOperator
+                                    compareValue
+                                    contextItemId
+                                    contextItemType
+                                    sourceItemId
+                                    sourceItemType
+                                }
+                            }
+                            postLogicRules {
+                                logicRuleId
+                                action {
+                                    contextItemId
+                                    contextItemType
+                                    targetItemId
+                                    targetItemType
+                                    verb
+                                }
+                                condition {
+                                    compareOperator
+                                    compareValue
+                                    contextItemId
+                                    contextItemType
+                                    sourceItemId
+                                    sourceItemType
+                                }
+                            }
+                            otherwiseLogicRule {
+                                contextItemId
+                                contextItemType
+                                targetItemId
+                                targetItemType
+                            }
+                        }"""
+
+
+def survey_questions_selection(*fields: str) -> str:
+    """Return the project selection for the survey questions with the given fields."""
+    return """
+                ... on Survey {
+                    questions {
+                        id
+                        __typename""" + "".join(fields) + """
+                    }
+                }
+        """
+
+
+def survey_questions_query(*fields: str) -> str:
+    """Return a survey questions query requesting the given fields."""
+    return """
+            query SurveyQuestions($project_id: ID!) {
+                project(id: $project_id) {""" + survey_questions_selection(*fields) + """}
+            }
+        """
+
 
 class QuestionsStream(ProjectBasedStream):
     """Define custom stream."""
@@ -622,175 +1008,95 @@ class QuestionsStream(ProjectBasedStream):
     ).to_dict()
     primary_keys = ["project_id", "id"]
     replication_key = None
+    change_detection = True
     records_jsonpath = "$.data.project.questions[*]"
 
-    @property
-    def query(self) -> str:
-        return """
-            query SurveyQuestions($project_id: ID!) {
-                """  \
-            + f"project(id: $project_id)" + """{
-                ... on Survey {
-                    questions {
-                        id
-                        __typename
-                        ... on MatrixQuestion {
-                            required
-                        }
-                        ... on MultipleChoiceQuestion {
-                            required
-                        }
-                        ... on MultipleChoiceStackQuestion {
-                            required
-                        }
-                        ... on NPSQuestion {
-                            required
-                        }
-                        ... on RankingQuestion {
-                            required
-                        }
-                        ... on RatingQuestion {
-                            required
-                        }
-                        ... on SliderQuestion {
-                            required
-                        }
-                        ... on TextEntryQuestion {
-                            required
-                        }
-                        content {
-                            backgroundImageUrl
-                            description
-                            title
-                            __typename
-                            ... on MatrixQuestionContent{
-                                columns {
-                                    id
-                                    hasFollowUp
-                                    followUpQuestion
-                                    label
-                                }
-                                moreInfoText
-                                rows {
-                                    id
-                                    title
-                                    description
-                                }
-                            }
-                            ... on MultipleChoiceContent {
-                                allowMultiple
-                                answers {
-                                    id
-                                    label
-                                }
-                                multipleChoiceMaxSelectionCount: maxSelectionCount
-                                moreInfoText
-                                showOther
-                            }
-                            ... on MultipleChoiceStackContent {
-                                allowMultiple
-                                answers {
-                                    id
-                                    label
-                                }
-                                multipleChoiceStackContentMaxSelectionCount: maxSelectionCount
-                                moreInfoText
-                                showOther
-                                subQuestions {
-                                    id
-                                    title
-                                    description
-                                }
-                            }
-                            ... on NPSQuestionContent {
-                                showLabels
-                                labels {
-                                    left
-                                    right
-                                }
-                            }
-                            ... on RankingQuestionContent {
-                                answers {
-                                    id
-                                    label
-                                }
-                                randomizeAnswers
-                                showOther
-                            }
-                            ... on SliderQuestionContent{
-                                labels {
-                                    left
-                                    middle
-                                    right
-                                }
-                                showLabels
-                                steps
-                            }
-                            ... on TextEntryQuestionContent{
-                                inputs
-                                placeholderText {
-                                    id
-                                    label
-                                }
-                            }
-                        }
-                        hidden
-                        logic {
-                            preLogicRules {
-                                logicRuleId
-                                action {
-                                    contextItemId
-                                    contextItemType
-                                    targetItemId
-                                    targetItemType
-                                    verb
-                                }
-                                condition {
-                                    compareOperator
-                                    compareValue
-                                    contextItemId
-                                    contextItemType
-                                    sourceItemId
-                                    sourceItemType
-                                }
-                            }
-                            postLogicRules {
-                                logicRuleId
-                                action {
-                                    contextItemId
-                                    contextItemType
-                                    targetItemId
-                                    targetItemType
-                                    verb
-                                }
-                                condition {
-                                    compareOperator
-                                    compareValue
-                                    contextItemId
-                                    contextItemType
-                                    sourceItemId
-                                    sourceItemType
-                                }
-                            }
-                            otherwiseLogicRule {
-                                contextItemId
-                                contextItemType
-                                targetItemId
-                                targetItemType
-                            }
-                        }
-                        metadata {
-                            createdBy {
-                                id
-                                name
-                                email
-                            }
-                            createdUTC
-                            lastModifiedUTC
-                        }
-                    }
-                }
-            }
-        }
+    project_selection = survey_questions_selection(
+        QUESTION_CORE_FIELDS, QUESTION_CONTENT_FIELDS, QUESTION_LOGIC_FIELDS
+    )
+    query = survey_questions_query(
+        QUESTION_CORE_FIELDS, QUESTION_CONTENT_FIELDS, QUESTION_LOGIC_FIELDS
+    )
+    split_queries = [
+        survey_questions_query(QUESTION_CORE_FIELDS),
+        survey_questions_query(QUESTION_CONTENT_FIELDS),
+        survey_questions_query(QUESTION_LOGIC_FIELDS),
+    ]
+
+    def request_records(
+        self, context: Optional[dict], store_count: bool = True
+    ) -> Iterable[dict]:
+        """Request the questions with one query, or with `split_queries` if needed.
+
+        Projects that had at least `questions_split_threshold` questions in the
+        last sync are requested with the split queries. With
+        `questions_split_on_error`, a failing single query is retried as split
+        queries too. The question count is stored for the next sync if this
+        stream is selected, unless sampling or `store_count` is False, as it is
+        for other streams requesting the questions.
         """
+        threshold = self.config.get("questions_split_threshold")
+        split_on_error = self.config.get("questions_split_on_error")
+        if threshold is None and not split_on_error:
+            yield from super().request_records(context)
+            return
+
+        if threshold is not None and self.previous_question_count(context) >= threshold:
+            records = self.request_split_records(context)
+        else:
+            try:
+                # with split_on_error, the split queries take the place of page retries
+                response = self.request_query(
+                    self.query, context, recover=not split_on_error
+                )
+                failed = bool(self.graphql_errors(response))
+            except (FatalAPIError, RetriableAPIError, requests.RequestException):
+                if not split_on_error:
+                    raise
+                failed = True
+            if failed and split_on_error:
+                self.logger.warning(
+                    "Questions query failed for project_id '%s', retrying with "
+                    "split queries.",
+                    context["project_id"],
+                )
+                records = self.request_split_records(context)
+            else:
+                records = list(self.parse_response(response))
+
+        stored = store_count and self.selected and not self.is_sampling
+        if threshold is not None and stored:
+            self.get_context_state(context)["question_count"] = len(records)
+        yield from records
+
+    def previous_question_count(self, context: dict) -> int:
+        """Return the question count stored for a project, without adding it to state."""
+        stream_state = self.tap_state.get("bookmarks", {}).get(self.name, {})
+        for partition in stream_state.get("partitions", []):
+            if partition.get("context", {}).get("project_id") == context["project_id"]:
+                return partition.get("question_count", 0)
+        return 0
+
+    def request_split_records(self, context: dict) -> List[dict]:
+        """Run `split_queries` concurrently and merge their rows by question id."""
+        with ThreadPoolExecutor(max_workers=len(self.split_queries)) as executor:
+            responses = list(
+                executor.map(
+                    lambda query: self.request_query(query, context),
+                    self.split_queries,
+                )
+            )
+
+        questions: Dict[str, dict] = {}
+        for response in responses:
+            for row in self.parse_response(response):
+                if row is not None:  # nulled by an error kept in a partial response
+                    questions.setdefault(row["id"], {}).update(row)
+        self.logger.info(
+            "Requested %d questions for project_id '%s' with %d split queries.",
+            len(questions),
+            context["project_id"],
+            len(self.split_queries),
+        )
+        return list(questions.values())
 
@@ -1,9 +1,22 @@
 """sparkthink tap class."""
 
-from typing import List
+import copy
+import os
+import socket
+import sys
+import time
+from functools import cached_property
+from typing import Any, List, Optional, Set
 
 from singer_sdk import Tap, Stream
 from singer_sdk import typing as th  # JSON schema typing helpers
+from singer_sdk._singerlib import Message, StateMessage
+
+from tap_sparkthink.changes import ChangeIndex
+from tap_sparkthink.client import ProjectBasedStream, compact_state
+from tap_sparkthink.output import OutputWriter
+from tap_sparkthink.transport import HTTP2Transport
+from tap_sparkthink.workqueue import ProjectWorkQueue
 
 # TODO: Import your custom stream types here:
 from tap_sparkthink.streams import (
@@ -13,6 +26,8 @@ from tap_sparkthink.streams import (
     TeamMembersStream,
     RespondentsStream,
     ResponsesStream,
+    ResponseOptionValuesStream,
+    ResponseTextValuesStream,
     QuestionsStream,
 )
 # TODO: Compile a list of custom stream types here
@@ -23,6 +38,8 @@ STREAM_TYPES = [
     TeamMembersStream,
     RespondentsStream,
     ResponsesStream,
+    ResponseOptionValuesStream,
+    ResponseTextValuesStream,
     QuestionsStream,
 ]
 
@@ -38,8 +55,431 @@ class Tapsparkthink(Tap):
         th.Property("client_secret", th.StringType, required=True),
         th.Property("project_ids", th.StringType, required=True),
         th.Property("response_batch_size", th.StringType, required=False),
+        th.Property(
+            "denormalize_question_metadata",
+            th.BooleanType,
+            required=False,
+            description=(
+                "Fetch each project's questions before its responses and add "
+                "`questionType`, `questionTitle` and `questionRequired` to every "
+                "response."
+            ),
+        ),
+        th.Property(
+            "request_timeout",
+            th.NumberType,
+            required=False,
+            description="Timeout in seconds of API requests (default 300).",
+        ),
+        th.Property(
+            "stream_request_timeouts",
+            th.ObjectType(additional_properties=th.NumberType),
+            required=False,
+            description=(
+                "Request timeouts in seconds by stream name, overriding "
+                "`request_timeout` (e.g. {\"responses\": 600})."
+            ),
+        ),
+        th.Property(
+            "pagination_prefetch_depth",
+            th.IntegerType,
+            required=False,
+            description=(
+                "Number of pages to request ahead of the page being emitted. "
+                "0 (the default) fetches pages strictly one after another."
+            ),
+        ),
+        th.Property(
+            "sparse_responses",
+            th.BooleanType,
+            required=False,
+            description=(
+                "Leave out the union fields that do not apply to a response's "
+                "`__typename`, null properties and empty objects from `responses` "
+                "records."
+            ),
+        ),
+        th.Property(
+            "combined_project_fetch",
+            th.BooleanType,
+            required=False,
+            description=(
+                "Fetch the selected `project`, `teamMembers` and `questions` "
+                "fields with a single query per project."
+            ),
+        ),
+        th.Property(
+            "change_detection_path",
+            th.StringType,
+            required=False,
+            description=(
+                "Path of a SQLite file holding record hashes. When set, the "
+                "project, teamMembers, respondents and questions streams only "
+                "emit records that are new or changed since the previous run."
+            ),
+        ),
+        th.Property(
+            "change_detection_tombstones",
+            th.BooleanType,
+            required=False,
+            description=(
+                "With `change_detection_path`, also emit records with "
+                "`_sdc_deleted_at` set for keys that disappeared."
+            ),
+        ),
+        th.Property(
+            "hedge_latency_percentile",
+            th.NumberType,
+            required=False,
+            description=(
+                "Send a duplicate of any request slower than this percentile of "
+                "the stream's latencies measured during the run (e.g. 95), and use "
+                "whichever answers first. Hedging is disabled when unset."
+            ),
+        ),
+        th.Property(
+            "hedge_max_ratio",
+            th.NumberType,
+            required=False,
+            description="Maximum share of extra hedged requests (default 0.05).",
+        ),
+        th.Property(
+            "hedge_min_samples",
+            th.IntegerType,
+            required=False,
+            description="Latencies to measure before hedging starts (default 20).",
+        ),
+        th.Property(
+            "persisted_queries",
+            th.BooleanType,
+            required=False,
+            description=(
+                "Send automatic persisted query hashes instead of full GraphQL "
+                "documents, falling back to the full text when the server does "
+                "not know a hash yet."
+            ),
+        ),
+        th.Property(
+            "schedule_largest_projects_first",
+            th.BooleanType,
+            required=False,
+            description=(
+                "Sync projects in order of the duration recorded in state for "
+                "their previous sync, longest first. Projects without recorded "
+                "durations go first."
+            ),
+        ),
+        th.Property(
+            "state_message_interval_seconds",
+            th.IntegerType,
+            required=False,
+            description=(
+                "Minimum number of seconds between STATE messages. The final "
+                "state is always written."
+            ),
+        ),
+        th.Property(
+            "state_message_record_count",
+            th.IntegerType,
+            required=False,
+            description="Number of records per stream between STATE messages.",
+        ),
+        th.Property(
+            "work_queue_path",
+            th.StringType,
+            required=False,
+            description=(
+                "Path of a SQLite file shared by several tap processes. Each "
+                "process claims projects from it until all are synced. Use a "
+                "fresh file for every run."
+            ),
+        ),
+        th.Property(
+            "work_queue_lease_seconds",
+            th.IntegerType,
+            required=False,
+            description="How long a claimed project stays leased to a worker.",
+        ),
+        th.Property(
+            "worker_id",
+            th.StringType,
+            required=False,
+            description="Name of this worker in the work queue (default host-pid).",
+        ),
+        th.Property(
+            "http_transport",
+            th.StringType,
+            required=False,
+            allowed_values=["requests", "http2"],
+            description=(
+                "'http2' multiplexes all GraphQL requests over a few HTTP/2 "
+                "connections using asyncio (requires the `http2` extra). Defaults to "
+                "'requests'."
+            ),
+        ),
+        th.Property(
+            "http2_max_connections",
+            th.IntegerType,
+            required=False,
+            description="Maximum number of HTTP/2 connections to `api_endpoint`.",
+        ),
+        th.Property(
+            "questions_split_threshold",
+            th.IntegerType,
+            required=False,
+            description=(
+                "Request the questions of projects that had at least this many "
+                "questions in the last sync with separate concurrent queries for "
+                "core fields, content and logic, merged by question id."
+            ),
+        ),
+        th.Property(
+            "questions_split_on_error",
+            th.BooleanType,
+            required=False,
+            description=(
+                "Retry the questions of a project with the split queries when "
+                "the single query fails."
+            ),
+        ),
+        th.Property(
+            "sample_project_fraction",
+            th.NumberType,
+            required=False,
+            description=(
+                "Sampling mode: sync only this fraction (0 to 1) of the configured "
+                "projects, chosen by a hash of the project ID so runs are repeatable."
+            ),
+        ),
+        th.Property(
+            "sample_max_pages",
+            th.IntegerType,
+            required=False,
+            description="Sampling mode: request at most this many pages per partition.",
+        ),
+        th.Property(
+            "sample_max_records_per_project",
+            th.IntegerType,
+            required=False,
+            description=(
+                "Sampling mode: sync at most this many records of a stream per "
+                "project, stopping pagination once reached."
+            ),
+        ),
+        th.Property(
+            "sample_max_records_per_stream",
+            th.IntegerType,
+            required=False,
+            description=(
+                "Sampling mode: sync at most this many records per stream, stopping "
+                "pagination once reached."
+            ),
+        ),
+        th.Property(
+            "output_queue_size",
+            th.IntegerType,
+            required=False,
+            description=(
+                "Serialize and write messages on a separate thread, buffering up "
+                "to this many messages, so a slow target does not stall fetching "
+                "until the buffer is full. Messages are written from the fetching "
+                "thread when unset."
+            ),
+        ),
     ).to_dict()
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self._last_state_message: Optional[dict] = None
+        self._state_message_written_at = 0.0
+        self._output_writer: Optional[OutputWriter] = None
+        #: Projects with data kept from responses with GraphQL errors. Shared by
+        #: all streams, since one request can feed several of them.
+        self.incomplete_projects: Set[str] = set()
+        super().__init__(*args, **kwargs)
+
+    def write_message(self, message: Message) -> None:
+        """Write a message, through the background writer while one is running."""
+        if self._output_writer is None:
+            super().write_message(message)
+            return
+        if isinstance(message, StateMessage):
+            # the tap keeps updating its state while the message waits in the queue
+            message = StateMessage(value=copy.deepcopy(message.value))
+        self._output_writer.write(message)
+
+    def write_state_message(self, force: bool = False) -> bool:
+        """Write the compacted tap state, throttled by `state_message_interval_seconds`.
+
+        Returns:
+            False if the message was held back because the interval has not passed.
+        """
+        interval = self.config.get("state_message_interval_seconds") or 0
+        now = time.monotonic()
+        if not force and now - self._state_message_written_at < interval:
+            return False
+
+        state = compact_state(self.state)
+        if state != self._last_state_message:
+            self.write_message(StateMessage(value=state))
+            self._last_state_message = copy.deepcopy(state)
+        self._state_message_written_at = now
+        return True
+
+    @cached_property
+    def http_transport(self) -> Optional[HTTP2Transport]:
+        """Return the shared HTTP/2 transport, or None to send with `requests`."""
+        if self.config.get("http_transport") != "http2":
+            return None
+        return HTTP2Transport(
+            max_connections=self.config.get("http2_max_connections") or 4
+        )
+
     def discover_streams(self) -> List[Stream]:
         """Return a list of discovered streams."""
         return [stream_class(tap=self) for stream_class in STREAM_TYPES]
+
+    @cached_property
+    def change_index(self) -> Optional[ChangeIndex]:
+        """Return the record hash index, or None to emit every record."""
+        if not self.config.get("change_detection_path"):
+            return None
+        return ChangeIndex(self.config["change_detection_path"])
+
+    def get_sync_streams(self) -> List[Stream]:
+        """Return the streams to sync, skipping those fed by another stream."""
+        combined = self.config.get("combined_project_fetch")
+        streams = []
+        for stream in self.streams.values():
+            if stream.parent_stream_type:
+                continue  # synced by its parent stream
+            if combined and isinstance(stream, ProjectStream):
+                if stream.selected or stream.shared_fetch_streams:
+                    streams.append(stream)
+                continue
+            if combined and isinstance(stream, ProjectBasedStream) and stream.project_selection:
+                continue  # fetched by ProjectStream's combined query
+            if stream.selected or stream.has_selected_descendents:
+                streams.append(stream)
+            else:
+                self.logger.info("Skipping deselected stream '%s'.", stream.name)
+        return streams
+
+    def sync_all(self) -> None:
+        """Sync all streams, or the projects claimed from the work queue."""
+        if self.config.get("output_queue_size"):
+            self._output_writer = OutputWriter(
+                self.format_message,
+                sys.stdout,
+                queue_size=self.config["output_queue_size"],
+            )
+        try:
+            self._reset_state_progress_markers()
+            self._set_compatible_replication_methods()
+            self.write_state_message(force=True)
+
+            streams = self.get_sync_streams()
+            if self.config.get("work_queue_path"):
+                self.sync_work_queue(streams)
+            else:
+                for stream in streams:
+                    stream.sync()
+                    stream.finalize_state_progress_markers()
+
+            # flush any state held back by the emission interval
+            self.write_state_message(force=True)
+            if self._output_writer is not None:
+                self.close_output_writer()
+            # all records are written, so the next run may skip unchanged ones
+            if self.change_index is not None:
+                self.change_index.commit()
+
+            # log costs of all streams, including those synced through another one
+            for stream in self.streams.values():
+                stream.log_sync_costs()
+        finally:
+            for stream in self.streams.values():
+                stream.close_hedging()
+            # only close what was built, building it here could hide the original error
+            if self.__dict__.get("http_transport") is not None:
+                self.http_transport.close()
+            if self.__dict__.get("change_index") is not None:
+                self.change_index.close()
+            if self._output_writer is not None:
+                self.close_output_writer()
+
+    def close_output_writer(self) -> None:
+        """Write the queued messages, stop the writer and log its utilization."""
+        writer, self._output_writer = self._output_writer, None
+        writer.close()
+        self.logger.info(
+            "Wrote %d messages in the background, fetching was blocked on the "
+            "output for %.1fs and the writer was idle for %.1fs.",
+            writer.messages,
+            writer.producer_blocked_seconds,
+            writer.writer_idle_seconds,
+        )
+
+    def get_project_ids_by_cost(self, project_streams: List[ProjectBasedStream]) -> List[str]:
+        """Return the configured project IDs, most expensive first if enabled."""
+        if not project_streams:
+            return []
+        project_ids = project_streams[0].project_ids
+        if not self.config.get("schedule_largest_projects_first"):
+            return project_ids
+
+        def cost(project_id: str) -> float:
+            context = {"project_id": project_id}
+            return sum(stream.estimated_cost(context) for stream in project_streams)
+
+        return sorted(project_ids, key=lambda project_id: -cost(project_id))
+
+    def sync_work_queue(self, streams: List[Stream]) -> None:
+        """Sync the projects this worker claims from the shared work queue."""
+        project_streams = [s for s in streams if isinstance(s, ProjectBasedStream)]
+        other_streams = [s for s in streams if not isinstance(s, ProjectBasedStream)]
+
+        worker_id = self.config.get("worker_id") or f"{socket.gethostname()}-{os.getpid()}"
+        queue = ProjectWorkQueue(
+            self.config["work_queue_path"],
+            lease_seconds=self.config.get("work_queue_lease_seconds") or 3600,
+        )
+        if queue.seed(self.get_project_ids_by_cost(project_streams)):
+            # streams not keyed on projects only need to run once, in the first worker
+            for stream in other_streams:
+                stream.sync()
+                stream.finalize_state_progress_markers()
+
+        while True:
+            project_id = queue.claim(worker_id)
+            if project_id is None:
+                break
+            self.logger.info("Worker '%s' claimed project '%s'.", worker_id, project_id)
+
+            project_state = {}
+            with queue.lease(project_id, worker_id):
+                for stream in project_streams:
+                    context = {
+                        "project_id": project_id,
+                        "response_batch_size": stream.response_batch_size
+                        or stream.response_default_batch_size,
+                    }
+                    stream.sync(context=context)
+                    project_state[stream.name] = stream.get_context_state(context)
+            if not queue.complete(project_id, worker_id, project_state):
+                self.logger.warning(
+                    "Worker '%s' lost its lease on project '%s', another worker "
+                    "synced it as well.",
+                    worker_id,
+                    project_id,
+                )
+
+        for stream in project_streams:
+            stream.finalize_state_progress_markers()
+
+        if queue.is_drained():
+            # the last worker to finish emits the state merged across all workers,
+            # as the tap state written by the final flush of `sync_all`
+            self.state.setdefault("bookmarks", {}).update(
+                queue.merged_state()["bookmarks"]
+            )
+        queue.close()
@@ -0,0 +1,30 @@
+"""Shared fixtures for tap-sparkthink tests."""
+
+import datetime
+
+import pytest
+import requests
+
+from tap_sparkthink.auth import sparkthinkAuthenticator
+from tap_sparkthink.client import sparkthinkStream
+from tap_sparkthink.tests.fake_api import FakeAPI
+
+
+@pytest.fixture
+def api(monkeypatch: pytest.MonkeyPatch) -> FakeAPI:
+    """Stub authentication and requests of all streams with a `FakeAPI`."""
+    fake = FakeAPI()
+
+    def update_access_token(authenticator: sparkthinkAuthenticator) -> None:
+        authenticator.access_token = "token"
+        authenticator.last_refreshed = datetime.datetime.now(datetime.timezone.utc)
+        authenticator.expires_in = 3600
+
+    def send(
+        stream: sparkthinkStream, prepared_request: requests.PreparedRequest
+    ) -> requests.Response:
+        return fake.send(prepared_request)
+
+    monkeypatch.setattr(sparkthinkAuthenticator, "update_access_token", update_access_token)
+    monkeypatch.setattr(sparkthinkStream, "_send", send)
+    return fake
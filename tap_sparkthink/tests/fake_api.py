@@ -0,0 +1,84 @@
+"""Fake sparkthink API and helpers for running the tap against it."""
+
+import contextlib
+import datetime
+import io
+import json
+from typing import Callable, List, Optional
+
+import requests
+
+from tap_sparkthink.tap import Tapsparkthink
+
+TEST_CONFIG = {
+    "auth_endpoint": "https://auth.example.com/",
+    "api_endpoint": "https://api.example.com/graphql",
+    "service_account_id": "service-account",
+    "client_secret": "secret",
+    "project_ids": "[p1, p2]",
+    "response_batch_size": "2",
+}
+
+
+class FakeAPI:
+    """Answer GraphQL requests with the JSON body returned by `handler`."""
+
+    def __init__(self) -> None:
+        self.payloads: List[dict] = []
+        self.handler: Callable[[dict], dict] = lambda payload: {"data": None}
+
+    def send(self, prepared_request: requests.PreparedRequest) -> requests.Response:
+        """Return the response to a prepared GraphQL request."""
+        payload = json.loads(prepared_request.body)
+        self.payloads.append(payload)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(self.handler(payload)).encode()
+        response.request = prepared_request
+        response.url = prepared_request.url
+        response.elapsed = datetime.timedelta(seconds=0.01)
+        return response
+
+    def queries(self, field: str) -> List[dict]:
+        """Return the payloads sent whose query requests `field`."""
+        return [payload for payload in self.payloads if field in payload["query"]]
+
+
+def make_tap(
+    selected: List[str], state: Optional[dict] = None, **config
+) -> Tapsparkthink:
+    """Return a tap with only the `selected` streams selected."""
+    tap = Tapsparkthink(config={**TEST_CONFIG, **config}, parse_env_config=False)
+    catalog = tap.catalog_dict
+    for stream in catalog["streams"]:
+        for metadata in stream["metadata"]:
+            if metadata["breadcrumb"] == []:
+                metadata["metadata"]["selected"] = stream["tap_stream_id"] in selected
+    return Tapsparkthink(
+        config={**TEST_CONFIG, **config},
+        catalog=catalog,
+        state=state,
+        parse_env_config=False,
+    )
+
+
+def sync(tap: Tapsparkthink) -> List[dict]:
+    """Run `tap.sync_all()` and return the Singer messages it wrote."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tap.sync_all()
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def records(messages: List[dict], stream: str) -> List[dict]:
+    """Return the records written for `stream`."""
+    return [
+        message["record"]
+        for message in messages
+        if message["type"] == "RECORD" and message["stream"] == stream
+    ]
+
+
+def final_state(messages: List[dict]) -> dict:
+    """Return the value of the last STATE message."""
+    return [message for message in messages if message["type"] == "STATE"][-1]["value"]
@@ -0,0 +1,111 @@
+"""Tests for change detection."""
+
+import pytest
+
+from tap_sparkthink.changes import ChangeIndex, record_hash
+from tap_sparkthink.tests.fake_api import make_tap, records, sync
+
+
+def test_record_hash_ignores_key_order():
+    assert record_hash({"a": 1, "b": [1, 2]}) == record_hash({"b": [1, 2], "a": 1})
+    assert record_hash({"a": 1}) != record_hash({"a": 2})
+    assert len(record_hash({"a": 1})) == 16
+
+
+def test_change_index_replaces_a_partition(tmp_path):
+    index = ChangeIndex(str(tmp_path / "changes.db"))
+    index.replace("questions", "p1", {"k1": b"h1", "k2": b"h2"})
+    index.replace("questions", "p2", {"k1": b"other"})
+    index.replace("questions", "p1", {"k2": b"h3"})
+
+    assert index.load("questions", "p1") == {"k2": b"h3"}
+    assert index.load("questions", "p2") == {"k1": b"other"}
+    assert index.load("teamMembers", "p1") == {}
+    index.close()
+
+
+def test_staged_partitions_are_only_stored_on_commit(tmp_path):
+    path = str(tmp_path / "changes.db")
+    index = ChangeIndex(path)
+    index.replace("questions", "p1", {"k1": b"h1"})
+    index.replace("questions", "p2", {"k1": b"h1"})
+    index.stage("questions", "p1", {"k2": b"h2"})
+    index.stage("questions", "p2", {})
+    assert index.load("questions", "p1") == {"k1": b"h1"}
+
+    index.commit()
+    assert index.load("questions", "p1") == {"k2": b"h2"}
+    assert index.load("questions", "p2") == {}
+
+    index.stage("questions", "p1", {"k3": b"h3"})
+    index.close()
+    index = ChangeIndex(path)
+    assert index.load("questions", "p1") == {"k2": b"h2"}
+    index.close()
+
+
+def team_members_handler(payload: dict) -> dict:
+    members = [{"id": "m1", "name": "Member", "email": "m@example.com"}]
+    if payload["variables"]["project_id"] == "p1":
+        members.append({"id": "m2", "name": "Other", "email": "o@example.com"})
+    return {"data": {"project": {"teamMembers": members}}}
+
+
+def test_unchanged_records_are_skipped_and_deletions_tombstoned(api, tmp_path):
+    config = {
+        "change_detection_path": str(tmp_path / "changes.db"),
+        "change_detection_tombstones": True,
+    }
+    api.handler = team_members_handler
+    first = records(sync(make_tap(["teamMembers"], **config)), "teamMembers")
+    assert len(first) == 3
+
+    api.handler = lambda payload: {
+        "data": {"project": {"teamMembers": [{"id": "m1", "name": "Member", "email": "m@example.com"}]}}
+    }
+    second = records(sync(make_tap(["teamMembers"], **config)), "teamMembers")
+
+    assert [(r["project_id"], r["id"]) for r in second] == [("p1", "m2")]
+    assert second[0]["_sdc_deleted_at"]
+
+
+def test_newly_selected_properties_are_backfilled(api, tmp_path):
+    path = str(tmp_path / "changes.db")
+    api.handler = team_members_handler
+    tap = make_tap(["teamMembers"], change_detection_path=path)
+    tap.streams["teamMembers"].metadata[("properties", "email")].selected = False
+    first = records(sync(tap), "teamMembers")
+    assert len(first) == 3 and "email" not in first[0]
+
+    second = records(sync(make_tap(["teamMembers"], change_detection_path=path)), "teamMembers")
+
+    assert len(second) == 3
+    assert all(record["email"] for record in second)
+
+
+def test_failed_syncs_do_not_store_hashes(api, tmp_path):
+    config = {"change_detection_path": str(tmp_path / "changes.db")}
+
+    def handler(payload: dict) -> dict:
+        if payload["variables"]["project_id"] == "p2":
+            raise RuntimeError("connection reset")
+        return team_members_handler(payload)
+
+    api.handler = handler
+    with pytest.raises(RuntimeError):
+        sync(make_tap(["teamMembers"], **config))
+
+    api.handler = team_members_handler
+    assert len(records(sync(make_tap(["teamMembers"], **config)), "teamMembers")) == 3
+
+
+def test_tombstone_property_needs_a_change_detection_path():
+    tap = make_tap(["teamMembers"], change_detection_tombstones=True)
+    assert "_sdc_deleted_at" not in tap.streams["teamMembers"].schema["properties"]
+
+    tap = make_tap(
+        ["teamMembers"],
+        change_detection_tombstones=True,
+        change_detection_path="changes.db",
+    )
+    assert "_sdc_deleted_at" in tap.streams["teamMembers"].schema["properties"]
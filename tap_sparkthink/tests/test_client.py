@@ -0,0 +1,126 @@
+"""Tests for the GraphQL client helpers and base stream classes."""
+
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+
+from tap_sparkthink.client import (
+    PERSISTED_QUERY_DOCUMENTS,
+    compact_state,
+    minify_query,
+    persisted_query_hash,
+    sparkthinkStream,
+)
+from tap_sparkthink.tests.fake_api import make_tap, records, sync
+
+
+def test_minify_query_drops_comments_and_insignificant_whitespace():
+    query = """
+        # list the project's questions
+        query Questions($project_id: ID!, $first: Int = 10) {
+            project(id: $project_id) {
+                questions(first: $first) { id, title }
+            }
+        }
+    """
+    assert minify_query(query) == (
+        "query Questions($project_id:ID!$first:Int=10){"
+        "project(id:$project_id){questions(first:$first){id title}}}"
+    )
+
+
+def test_minify_query_keeps_string_literals():
+    query = 'query { search(text: "a,  b # c") { id } }'
+    assert minify_query(query) == 'query{search(text:"a,  b # c"){id}}'
+
+
+def test_persisted_query_hash_registers_the_document():
+    digest = persisted_query_hash("query{me{id}}")
+    assert digest == hashlib.sha256(b"query{me{id}}").hexdigest()
+    assert PERSISTED_QUERY_DOCUMENTS[digest] == "query{me{id}}"
+
+
+def test_compact_state_drops_partitions_without_bookmarks():
+    state = {
+        "bookmarks": {
+            "questions": {
+                "partitions": [
+                    {"context": {"project_id": "p1"}, "starting_replication_value": None},
+                    {"context": {"project_id": "p2"}, "question_count": 3},
+                ]
+            },
+            "teamMembers": {"partitions": [{"context": {"project_id": "p1"}}]},
+            "my_projects": {"starting_replication_value": None},
+        },
+        "currently_syncing": None,
+    }
+
+    assert compact_state(state) == {
+        "bookmarks": {
+            "questions": {
+                "partitions": [{"context": {"project_id": "p2"}, "question_count": 3}]
+            },
+            "my_projects": {"starting_replication_value": None},
+        },
+        "currently_syncing": None,
+    }
+
+
+def test_compact_state_does_not_modify_the_state():
+    state = {"bookmarks": {"teamMembers": {"partitions": [{"context": {"project_id": "p1"}}]}}}
+    compact_state(state)
+    assert state["bookmarks"]["teamMembers"]["partitions"]
+
+
+def test_slow_requests_are_hedged(api):
+    calls = []
+
+    def handler(payload: dict) -> dict:
+        calls.append(payload)
+        if len(calls) == 2:
+            time.sleep(0.3)  # the first request for p2 hangs, its hedge does not
+        return {"data": {"project": {"teamMembers": [{"id": "m1"}]}}}
+
+    api.handler = handler
+    tap = make_tap(
+        ["teamMembers"],
+        hedge_latency_percentile=50,
+        hedge_min_samples=1,
+        hedge_max_ratio=1,
+    )
+
+    messages = sync(tap)
+
+    stream = tap.streams["teamMembers"]
+    assert stream._hedge_counts == {"requests": 2, "sent": 1, "won": 1}
+    assert len(records(messages, "teamMembers")) == 2
+    assert stream._hedge_executor is None
+    time.sleep(0.5)
+    assert not [t for t in threading.enumerate() if "hedge" in t.name]
+
+
+def test_closing_hedging_cancels_queued_requests(api):
+    api.handler = lambda payload: {"data": {"project": {"teamMembers": []}}}
+    release = threading.Event()
+    send = api.send
+    api.send = lambda prepared_request: release.wait() and send(prepared_request)
+    stream = make_tap(["teamMembers"]).streams["teamMembers"]
+    request = stream.prepare_query_request(stream.query, {"project_id": "p1"}, None)
+
+    futures = [stream.submit_hedged(request) for _ in range(5)]  # 4 threads
+    stream.close_hedging()
+    release.set()
+
+    assert futures[-1].cancelled()
+    assert all(future.result().status_code == 200 for future in futures[:4])
+    assert not stream._hedge_futures
+
+
+def test_first_successful_skips_failed_futures():
+    failed, succeeded = Future(), Future()
+    failed.set_exception(RuntimeError("boom"))
+    succeeded.set_result("ok")
+
+    assert sparkthinkStream.first_successful([failed, succeeded]) is succeeded
+    assert sparkthinkStream.first_successful([failed]) is failed
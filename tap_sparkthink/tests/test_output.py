@@ -0,0 +1,54 @@
+"""Tests for the background output writer."""
+
+import io
+
+import pytest
+
+from tap_sparkthink.output import OutputWriter
+from tap_sparkthink.tests.fake_api import make_tap, records, sync
+
+
+class FailingOutput(io.StringIO):
+    def write(self, text: str) -> int:
+        raise OSError("broken pipe")
+
+
+def test_messages_are_written_in_order():
+    output = io.StringIO()
+    writer = OutputWriter(str, output, queue_size=2)
+    for number in range(100):
+        writer.write(number)
+    writer.close()
+
+    assert output.getvalue().splitlines() == [str(number) for number in range(100)]
+    assert writer.messages == 100
+
+
+def test_write_errors_are_raised_to_the_producer():
+    writer = OutputWriter(str, FailingOutput(), queue_size=1)
+    writer.write("first")
+    with pytest.raises(RuntimeError):
+        for _ in range(100):
+            writer.write("more")
+    with pytest.raises(RuntimeError) as error:
+        writer.close()
+    assert isinstance(error.value.__cause__, OSError)
+
+
+def test_background_output_matches_direct_output(api):
+    api.handler = lambda payload: {
+        "data": {"project": {"teamMembers": [{"id": f"m{n}"} for n in range(5)]}}
+    }
+    config = {"state_message_interval_seconds": 0, "state_message_record_count": 2}
+
+    direct = sync(make_tap(["teamMembers"], **config))
+    background = sync(make_tap(["teamMembers"], output_queue_size=2, **config))
+
+    def without_times(messages):
+        return [
+            {key: value for key, value in message.items() if key != "time_extracted"}
+            for message in messages
+        ]
+
+    assert without_times(background) == without_times(direct)
+    assert len(records(background, "teamMembers")) == 10
@@ -0,0 +1,63 @@
+"""Tests for prefetching response pages in a background thread."""
+
+import threading
+
+import pytest
+
+from tap_sparkthink.tests.fake_api import make_tap, records, sync
+from tap_sparkthink.tests.test_sampling import responses_handler
+
+
+def prefetch_threads() -> list:
+    return [t for t in threading.enumerate() if t.name.endswith("-prefetch")]
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_prefetched_records_keep_their_order(api, depth):
+    api.handler = responses_handler
+    messages = sync(make_tap(["responses"], pagination_prefetch_depth=depth))
+
+    assert [r["id"] for r in records(messages, "responses")] == [
+        f"{project_id}-r{number}" for project_id in ("p1", "p2") for number in range(10)
+    ]
+    assert len(api.payloads) == 12  # 5 pages and an empty one per project
+    assert [p["variables"].get("cursor") for p in api.payloads[:6]] == [
+        None, "2", "4", "6", "8", "10",
+    ]
+    assert not prefetch_threads()
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_record_limit_stops_prefetching(api, depth):
+    api.handler = responses_handler
+    messages = sync(
+        make_tap(
+            ["responses"],
+            pagination_prefetch_depth=depth,
+            sample_max_records_per_project=3,
+        )
+    )
+
+    assert [r["id"] for r in records(messages, "responses")] == [
+        "p1-r0", "p1-r1", "p1-r2", "p2-r0", "p2-r1", "p2-r2",
+    ]
+    # besides the 2 pages read, at most `depth` buffered pages and one blocked
+    # on the full buffer are requested per project
+    assert 4 <= len(api.payloads) <= 2 * (2 + depth + 1)
+    assert not prefetch_threads()
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_request_errors_are_raised_to_the_consumer(api, depth):
+    def handler(payload: dict) -> dict:
+        if payload["variables"].get("cursor") == "4":
+            raise RuntimeError("connection reset")
+        return responses_handler(payload)
+
+    api.handler = handler
+    tap = make_tap(["responses"], pagination_prefetch_depth=depth)
+    with pytest.raises(RuntimeError, match="connection reset"):
+        sync(tap)
+
+    assert len(api.payloads) == 3
+    assert not prefetch_threads()
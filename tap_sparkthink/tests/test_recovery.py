@@ -0,0 +1,167 @@
+"""Tests for request timeouts and the recovery of pages with GraphQL errors."""
+
+from tap_sparkthink.tests.fake_api import make_tap, records, sync
+
+
+def responses_handler(failing_batch_sizes: tuple, failures: int = 10**6):
+    """Answer 6 responses per project, failing the page after cursor "2".
+
+    The page fails `failures` times when requested with a batch size in
+    `failing_batch_sizes`, with its last response nulled out.
+    """
+    failed = []
+
+    def handler(payload: dict) -> dict:
+        variables = payload["variables"]
+        start = int(variables.get("cursor") or 0)
+        size = int(variables["response_batch_size"])
+        edges = [
+            {"cursor": str(n + 1), "node": {"id": f"{variables['project_id']}-r{n}"}}
+            for n in range(start, min(start + size, 6))
+        ]
+        body = {"data": {"project": {"responses": {"edges": edges}}}}
+        if start == 2 and size in failing_batch_sizes and len(failed) < failures:
+            failed.append(variables)
+            edges[-1]["node"] = None
+            body["errors"] = [{"message": "Internal error", "path": ["project", "responses"]}]
+        return body
+
+    return handler
+
+
+def test_failed_page_is_retried_once(api):
+    api.handler = responses_handler(failing_batch_sizes=(2,), failures=1)
+    tap = make_tap(["responses"])
+
+    messages = sync(tap)
+
+    assert len(records(messages, "responses")) == 12
+    assert len(api.payloads) == 9  # 4 pages per project and one retry
+    assert tap.incomplete_projects == set()
+
+
+def test_failed_page_is_retried_with_a_smaller_batch(api):
+    api.handler = responses_handler(failing_batch_sizes=(2,))
+    tap = make_tap(["responses"])
+
+    messages = sync(tap)
+
+    assert [r["id"] for r in records(messages, "responses")][:6] == [
+        f"p1-r{n}" for n in range(6)
+    ]
+    assert len(records(messages, "responses")) == 12
+    retried_sizes = [
+        int(payload["variables"]["response_batch_size"])
+        for payload in api.payloads
+        if payload["variables"]["project_id"] == "p1"
+        and payload["variables"].get("cursor") == "2"
+    ]
+    assert retried_sizes == [2, 2, 1]
+    assert tap.incomplete_projects == set()
+
+
+def test_partial_data_is_kept_when_retries_fail(api):
+    api.handler = responses_handler(failing_batch_sizes=(1, 2))
+    tap = make_tap(["responses"])
+
+    messages = sync(tap)
+
+    ids = [r["id"] for r in records(messages, "responses")]
+    assert "p1-r3" not in ids and len(ids) == 10
+    assert {} not in records(messages, "responses")
+    assert tap.incomplete_projects == {"p1", "p2"}
+
+
+def test_stream_request_timeouts():
+    tap = make_tap([], request_timeout=30, stream_request_timeouts={"responses": 600})
+    assert tap.streams["responses"].timeout == 600
+    assert tap.streams["questions"].timeout == 30
+    assert make_tap([]).streams["questions"].timeout == 300
+
+
+def combined_project_handler(failing: bool):
+    def handler(payload: dict) -> dict:
+        project = {
+            "title": "Project",
+            "teamMembers": [{"id": "m1"}],
+            "questions": [{"id": "q1"}],
+        }
+        if not failing:
+            return {"data": {"project": project}}
+        project["teamMembers"] = None
+        return {
+            "errors": [{"message": "Internal error", "path": ["project", "teamMembers"]}],
+            "data": {"project": project},
+        }
+
+    return handler
+
+
+def test_partial_combined_fetch_emits_no_tombstones(api, tmp_path):
+    config = {
+        "combined_project_fetch": True,
+        "change_detection_path": str(tmp_path / "changes.db"),
+        "change_detection_tombstones": True,
+    }
+    selected = ["project", "teamMembers", "questions"]
+    api.handler = combined_project_handler(failing=False)
+    assert len(records(sync(make_tap(selected, **config)), "teamMembers")) == 2
+
+    api.handler = combined_project_handler(failing=True)
+    tap = make_tap(selected, **config)
+    messages = sync(tap)
+
+    assert records(messages, "teamMembers") == []
+    assert tap.incomplete_projects == {"p1", "p2"}
+
+    # the kept hashes still suppress unchanged members once the API recovers
+    api.handler = combined_project_handler(failing=False)
+    assert records(sync(make_tap(selected, **config)), "teamMembers") == []
+
+
+def questions_handler(failing: bool):
+    def handler(payload: dict) -> dict:
+        questions = [{"id": "q1"}, {"id": "q2"}]
+        if not failing:
+            return {"data": {"project": {"questions": questions}}}
+        return {
+            "errors": [{"message": "Internal error", "path": ["project", "questions", 1]}],
+            "data": {"project": {"questions": [questions[0], None]}},
+        }
+
+    return handler
+
+
+def test_partial_questions_emit_no_tombstones(api, tmp_path):
+    config = {
+        "questions_split_threshold": 100,
+        "change_detection_path": str(tmp_path / "changes.db"),
+        "change_detection_tombstones": True,
+    }
+    api.handler = questions_handler(failing=False)
+    assert len(records(sync(make_tap(["questions"], **config)), "questions")) == 4
+
+    api.handler = questions_handler(failing=True)
+    tap = make_tap(["questions"], **config)
+    messages = sync(tap)
+
+    assert records(messages, "questions") == []
+    assert len(api.payloads) == 2 + 2 * 2  # first run, then a retry per project
+    assert tap.incomplete_projects == {"p1", "p2"}
+
+
+def test_partial_split_questions_emit_no_tombstones(api, tmp_path):
+    config = {
+        "questions_split_on_error": True,
+        "change_detection_path": str(tmp_path / "changes.db"),
+        "change_detection_tombstones": True,
+    }
+    api.handler = questions_handler(failing=False)
+    sync(make_tap(["questions"], **config))
+
+    api.handler = questions_handler(failing=True)
+    tap = make_tap(["questions"], **config)
+    messages = sync(tap)
+
+    assert records(messages, "questions") == []
+    assert tap.incomplete_projects == {"p1", "p2"}
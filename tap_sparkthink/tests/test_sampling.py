@@ -0,0 +1,103 @@
+"""Tests for the sampling mode."""
+
+from tap_sparkthink.client import is_sampled_project
+from tap_sparkthink.tests.fake_api import final_state, make_tap, records, sync
+
+
+def responses_handler(payload: dict) -> dict:
+    """Answer with 10 responses per project, in pages of `response_batch_size`."""
+    variables = payload["variables"]
+    start = int(variables.get("cursor") or 0)
+    edges = [
+        {"cursor": str(number + 1), "node": {"id": f"{variables['project_id']}-r{number}"}}
+        for number in range(start, min(start + int(variables["response_batch_size"]), 10))
+    ]
+    return {"data": {"project": {"responses": {"edges": edges}}}}
+
+
+def test_without_limits_all_pages_are_requested(api):
+    api.handler = responses_handler
+    messages = sync(make_tap(["responses"]))
+    assert len(records(messages, "responses")) == 20
+    assert len(api.payloads) == 12  # 5 pages and an empty one per project
+
+
+def test_max_pages_stops_pagination(api):
+    api.handler = responses_handler
+    messages = sync(make_tap(["responses"], sample_max_pages=2))
+    assert len(records(messages, "responses")) == 8
+    assert len(api.payloads) == 4
+
+
+def test_record_limit_per_project_stops_pagination(api):
+    api.handler = responses_handler
+    messages = sync(make_tap(["responses"], sample_max_records_per_project=3))
+    assert [r["id"] for r in records(messages, "responses")] == [
+        "p1-r0", "p1-r1", "p1-r2", "p2-r0", "p2-r1", "p2-r2",
+    ]
+    assert len(api.payloads) == 4
+
+
+def test_record_limit_per_stream_skips_remaining_projects(api):
+    api.handler = responses_handler
+    messages = sync(make_tap(["responses"], sample_max_records_per_stream=3))
+    assert len(records(messages, "responses")) == 3
+    assert {payload["variables"]["project_id"] for payload in api.payloads} == {"p1"}
+
+
+def test_project_sample_is_deterministic():
+    project_ids = [f"p{number}" for number in range(1000)]
+    sample = [p for p in project_ids if is_sampled_project(p, 0.1)]
+    assert 50 < len(sample) < 150
+    assert sample == [p for p in project_ids if is_sampled_project(p, 0.1)]
+    assert not [p for p in project_ids if is_sampled_project(p, 0)]
+    assert len([p for p in project_ids if is_sampled_project(p, 1)]) == 1000
+
+
+def test_sampling_runs_do_not_store_sync_stats(api):
+    api.handler = responses_handler
+    messages = sync(
+        make_tap(
+            ["responses"],
+            sample_max_records_per_project=3,
+            schedule_largest_projects_first=True,
+        )
+    )
+    assert "responses" not in final_state(messages)["bookmarks"]
+
+
+def test_sampling_runs_do_not_store_question_counts(api):
+    api.handler = lambda payload: {"data": {"project": {"questions": [{"id": "q1"}]}}}
+    messages = sync(
+        make_tap(["questions"], sample_max_pages=1, questions_split_threshold=10)
+    )
+    assert "questions" not in final_state(messages)["bookmarks"]
+
+
+def team_handler(payload: dict) -> dict:
+    """Answer project queries with three team members per project."""
+    members = [{"id": f"m{number}"} for number in range(3)]
+    return {"data": {"project": {"title": "Project", "teamMembers": members}}}
+
+
+def test_record_limits_apply_to_combined_project_fetches(api):
+    api.handler = team_handler
+    messages = sync(
+        make_tap(
+            ["project", "teamMembers"],
+            combined_project_fetch=True,
+            sample_max_records_per_project=2,
+        )
+    )
+    assert [(r["project_id"], r["id"]) for r in records(messages, "teamMembers")] == [
+        ("p1", "m0"), ("p1", "m1"), ("p2", "m0"), ("p2", "m1"),
+    ]
+
+    messages = sync(
+        make_tap(
+            ["project", "teamMembers"],
+            combined_project_fetch=True,
+            sample_max_records_per_stream=4,
+        )
+    )
+    assert len(records(messages, "teamMembers")) == 4
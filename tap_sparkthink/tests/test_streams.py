@@ -0,0 +1,247 @@
+"""Tests for the sparkthink stream classes."""
+
+from tap_sparkthink.streams import ResponsesStream
+from tap_sparkthink.tests.fake_api import final_state, make_tap, records, sync
+
+
+def test_response_option_values_flatten_nested_and_plain_options():
+    stream = make_tap([]).streams["response_option_values"]
+    response = {
+        "id": "r1",
+        "project_id": "p1",
+        "questionId": "q1",
+        "collectorId": "c1",
+        "NestedOptionResponseOptions": [
+            {
+                "id": "o1",
+                "label": "Option",
+                "value": [
+                    {"id": "v1", "label": "One", "additionalUserInput": None},
+                    {"id": "v2", "label": "Two", "additionalUserInput": "other"},
+                ],
+            }
+        ],
+        "OptionResponseValue": [{"id": "v3", "label": "Three"}],
+    }
+
+    rows = list(stream.get_child_records(response))
+
+    assert [(row["position"], row["optionId"], row["id"]) for row in rows] == [
+        (0, "o1", "v1"),
+        (1, "o1", "v2"),
+        (2, None, "v3"),
+    ]
+    assert rows[1]["additionalUserInput"] == "other"
+    assert all(row["response_id"] == "r1" and row["project_id"] == "p1" for row in rows)
+
+
+def test_response_option_values_of_a_response_without_options():
+    stream = make_tap([]).streams["response_option_values"]
+    assert list(stream.get_child_records({"id": "r1", "OptionResponseValue": None})) == []
+
+
+def test_response_text_values():
+    stream = make_tap([]).streams["response_text_values"]
+    response = {"id": "r1", "project_id": "p1", "TextResponseValue": [{"id": "t", "userInput": "hi"}]}
+
+    rows = list(stream.get_child_records(response))
+
+    assert rows == [
+        {
+            "project_id": "p1",
+            "response_id": "r1",
+            "questionId": None,
+            "collectorId": None,
+            "position": 0,
+            "id": "t",
+            "userInput": "hi",
+        }
+    ]
+
+
+def project_handler(payload: dict) -> dict:
+    """Answer project queries with a project holding one member and one question."""
+    project_id = payload["variables"]["project_id"]
+    project = {"title": f"Project {project_id}", "__typename": "Survey"}
+    if "teamMembers" in payload["query"]:
+        project["teamMembers"] = [{"id": "m1", "name": "Member", "role": "owner"}]
+    if "questions" in payload["query"]:
+        project["questions"] = [{"id": "q1", "__typename": "TextEntryQuestion"}]
+    return {"data": {"project": project}}
+
+
+def test_combined_project_fetch_requests_each_project_once(api):
+    api.handler = project_handler
+    tap = make_tap(
+        ["project", "teamMembers", "questions"], combined_project_fetch=True
+    )
+
+    messages = sync(tap)
+
+    assert [payload["variables"]["project_id"] for payload in api.payloads] == ["p1", "p2"]
+    assert [record["title"] for record in records(messages, "project")] == [
+        "Project p1",
+        "Project p2",
+    ]
+    assert "teamMembers" not in records(messages, "project")[0]
+    assert [(r["project_id"], r["id"]) for r in records(messages, "teamMembers")] == [
+        ("p1", "m1"),
+        ("p2", "m1"),
+    ]
+    assert [(r["project_id"], r["id"]) for r in records(messages, "questions")] == [
+        ("p1", "q1"),
+        ("p2", "q1"),
+    ]
+
+
+def test_combined_project_fetch_without_the_project_stream(api):
+    api.handler = project_handler
+    tap = make_tap(["teamMembers"], combined_project_fetch=True)
+
+    messages = sync(tap)
+
+    assert len(api.payloads) == 2
+    assert records(messages, "project") == []
+    assert len(records(messages, "teamMembers")) == 2
+
+
+def test_drop_empty_values_removes_nulls_and_empty_objects():
+    value = {
+        "id": "r1",
+        "active": False,
+        "locale": None,
+        "metadata": {"createdBy": {"id": None}, "createdUTC": "2024-01-01T00:00:00Z"},
+        "OptionResponseValue": [{"id": "a", "additionalUserInput": None}],
+        "TextResponseValue": [],
+    }
+    assert ResponsesStream.drop_empty_values(value) == {
+        "id": "r1",
+        "active": False,
+        "metadata": {"createdUTC": "2024-01-01T00:00:00Z"},
+        "OptionResponseValue": [{"id": "a"}],
+        "TextResponseValue": [],
+    }
+
+
+def test_sparse_responses_drop_fields_of_other_response_types():
+    stream = make_tap([], sparse_responses=True).streams["responses"]
+    row = {
+        "id": "r1",
+        "__typename": "TextResponse",
+        "TextResponseValue": [{"id": "t", "userInput": "hi"}],
+        "OptionResponseValue": [],
+        "NumericResponseValue": None,
+    }
+
+    assert stream.post_process(row, {"project_id": "p1"}) == {
+        "id": "r1",
+        "__typename": "TextResponse",
+        "TextResponseValue": [{"id": "t", "userInput": "hi"}],
+        "project_id": "p1",
+    }
+
+
+def questions_handler(payload: dict) -> dict:
+    """Answer each part of the questions query with just the fields it requests."""
+    query = payload["query"]
+    questions = []
+    for number in range(3):
+        question = {"id": f"q{number}", "__typename": "TextEntryQuestion"}
+        if "hidden" in query:
+            question["hidden"] = False
+        if "content" in query:
+            question["content"] = {"title": f"Question {number}"}
+        if "logic" in query:
+            question["logic"] = {"preLogicRules": []}
+        questions.append(question)
+    return {"data": {"project": {"questions": questions}}}
+
+
+def question_count_state(count: int) -> dict:
+    return {
+        "bookmarks": {
+            "questions": {
+                "partitions": [
+                    {"context": {"project_id": project_id}, "question_count": count}
+                    for project_id in ("p1", "p2")
+                ]
+            }
+        }
+    }
+
+
+def test_large_surveys_are_requested_with_split_queries(api):
+    api.handler = questions_handler
+    tap = make_tap(
+        ["questions"], state=question_count_state(3), questions_split_threshold=3
+    )
+
+    messages = sync(tap)
+
+    assert len(api.payloads) == 6
+    assert records(messages, "questions")[0] == {
+        "id": "q0",
+        "__typename": "TextEntryQuestion",
+        "hidden": False,
+        "content": {"title": "Question 0"},
+        "logic": {"preLogicRules": []},
+        "project_id": "p1",
+    }
+    assert len(records(messages, "questions")) == 6
+
+
+def test_small_surveys_use_the_single_query(api):
+    api.handler = questions_handler
+    tap = make_tap(
+        ["questions"], state=question_count_state(2), questions_split_threshold=3
+    )
+
+    messages = sync(tap)
+
+    assert len(api.payloads) == 2
+    partitions = final_state(messages)["bookmarks"]["questions"]["partitions"]
+    assert [partition["question_count"] for partition in partitions] == [3, 3]
+
+
+def test_failing_single_query_is_retried_split(api):
+    def handler(payload: dict) -> dict:
+        if "content" in payload["query"] and "logic" in payload["query"]:
+            return {"errors": [{"message": "query too complex"}], "data": None}
+        return questions_handler(payload)
+
+    api.handler = handler
+    messages = sync(make_tap(["questions"], questions_split_on_error=True))
+
+    assert len(api.payloads) == 8
+    assert len(records(messages, "questions")) == 6
+    assert records(messages, "questions")[0]["content"] == {"title": "Question 0"}
+
+
+def test_question_index_does_not_store_state_of_unselected_questions(api):
+    def handler(payload: dict) -> dict:
+        if "questions" in payload["query"]:
+            return questions_handler(payload)
+        edges = []
+        if not payload["variables"].get("cursor"):
+            edges = [{"cursor": "1", "node": {"id": "r1", "questionId": "q1"}}]
+        return {"data": {"project": {"responses": {"edges": edges}}}}
+
+    api.handler = handler
+    tap = make_tap(
+        ["responses"], denormalize_question_metadata=True, questions_split_threshold=3
+    )
+
+    messages = sync(tap)
+
+    assert "questions" not in final_state(messages)["bookmarks"]
+    assert records(messages, "responses")[0]["questionTitle"] == "Question 1"
+
+
+def test_question_index_does_not_store_question_counts(api):
+    api.handler = questions_handler
+    tap = make_tap(["questions", "responses"], questions_split_threshold=3)
+
+    index = tap.streams["responses"].get_question_index({"project_id": "p1"})
+
+    assert len(index) == 3
+    assert "questions" not in tap.state.get("bookmarks", {})
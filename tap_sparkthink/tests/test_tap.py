@@ -0,0 +1,53 @@
+"""Tests for tap-level sync behaviour."""
+
+from tap_sparkthink import tap as tap_module
+from tap_sparkthink.tests.fake_api import final_state, make_tap, records, sync
+
+
+def test_unused_http_transport_is_not_built_on_exit(api, monkeypatch):
+    def unavailable_transport(**kwargs):
+        raise RuntimeError("httpx is not installed")
+
+    monkeypatch.setattr(tap_module, "HTTP2Transport", unavailable_transport)
+    api.handler = lambda payload: {"data": {"project": {"teamMembers": []}}}
+    tap = make_tap(["teamMembers"], http_transport="http2")
+
+    sync(tap)
+
+    assert "http_transport" not in tap.__dict__
+
+
+def team_members_handler(payload: dict) -> dict:
+    return {"data": {"project": {"teamMembers": [{"id": "m1"}]}}}
+
+
+def test_final_state_has_no_partitions_without_bookmarks(api):
+    api.handler = team_members_handler
+    messages = sync(make_tap(["teamMembers"]))
+    assert final_state(messages)["bookmarks"] == {}
+
+
+def test_largest_projects_are_synced_first(api):
+    api.handler = team_members_handler
+    config = {"schedule_largest_projects_first": True}
+    state = final_state(sync(make_tap(["teamMembers"], **config)))
+    partitions = state["bookmarks"]["teamMembers"]["partitions"]
+    assert [p["context"]["project_id"] for p in partitions] == ["p1", "p2"]
+    assert all("seconds" in p["sync_stats"] for p in partitions)
+
+    partitions[1]["sync_stats"]["seconds"] = partitions[0]["sync_stats"]["seconds"] + 10
+    messages = sync(make_tap(["teamMembers"], state=state, **config))
+
+    assert [r["project_id"] for r in records(messages, "teamMembers")] == ["p2", "p1"]
+
+
+def test_project_order_is_computed_once(api, monkeypatch):
+    tap = make_tap(["teamMembers"], schedule_largest_projects_first=True)
+    stream = tap.streams["teamMembers"]
+    costs = []
+    monkeypatch.setattr(
+        stream, "estimated_cost", lambda context: costs.append(context) or 0.0
+    )
+
+    assert stream.partitions == stream.partitions
+    assert len(costs) == 2
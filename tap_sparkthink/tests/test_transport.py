@@ -0,0 +1,98 @@
+"""Tests for the HTTP/2 transport against a local server."""
+
+import datetime
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import pytest
+import requests
+
+from tap_sparkthink.transport import HTTP2Transport
+
+pytest.importorskip("httpx")
+
+
+class GraphQLHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/slow":
+            time.sleep(1)
+        content = json.dumps(
+            {"data": {"echo": json.loads(body), "auth": self.headers["Authorization"]}}
+        ).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Request-Id", "r1")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), GraphQLHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def transport() -> Iterator[HTTP2Transport]:
+    transport = HTTP2Transport(max_connections=2)
+    yield transport
+    transport.close()
+
+
+def prepare(url: str) -> requests.PreparedRequest:
+    return requests.Request(
+        "POST",
+        url,
+        headers={"Authorization": "Bearer token", "Connection": "keep-alive"},
+        json={"query": "{ me { id } }"},
+    ).prepare()
+
+
+def test_response_is_converted(server, transport):
+    request = prepare(f"{server}/graphql")
+
+    response = transport.send(request, timeout=5)
+
+    assert isinstance(response, requests.Response)
+    assert response.status_code == 201
+    assert response.ok
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["X-Request-Id"] == "r1"
+    assert response.json() == {
+        "data": {"echo": {"query": "{ me { id } }"}, "auth": "Bearer token"}
+    }
+    assert response.url == f"{server}/graphql"
+    assert response.request is request
+    assert isinstance(response.elapsed, datetime.timedelta)
+    assert response.elapsed > datetime.timedelta(0)
+
+
+def test_timeouts_raise_read_timeout(server, transport):
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        transport.send(prepare(f"{server}/slow"), timeout=0.1)
+
+
+def test_refused_connections_raise_connection_error(transport):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # nothing listens on the port once the socket is closed
+
+    with pytest.raises(requests.exceptions.ConnectionError) as error:
+        transport.send(prepare(f"http://127.0.0.1:{port}/graphql"), timeout=5)
+    assert not isinstance(error.value, requests.exceptions.ReadTimeout)
@@ -0,0 +1,97 @@
+"""Tests for the project work queue."""
+
+import time
+
+from tap_sparkthink.tests.fake_api import final_state, make_tap, records, sync
+from tap_sparkthink.workqueue import ProjectWorkQueue
+
+
+def test_seed_creates_the_queue_once(tmp_path):
+    queue = ProjectWorkQueue(str(tmp_path / "queue.db"))
+    assert queue.seed(["p1", "p2"])
+    assert not queue.seed(["p1", "p2", "p3"])
+    assert [queue.claim("w1") for _ in range(4)] == ["p1", "p2", "p3", None]
+
+
+def test_expired_lease_is_handed_out_again(tmp_path):
+    path = str(tmp_path / "queue.db")
+    first = ProjectWorkQueue(path, lease_seconds=0)
+    second = ProjectWorkQueue(path, lease_seconds=3600)
+    first.seed(["p1"])
+
+    assert first.claim("w1") == "p1"
+    time.sleep(0.01)
+    assert second.claim("w2") == "p1"
+    assert not first.complete("p1", "w1", {})
+    assert second.complete("p1", "w2", {})
+    assert second.is_drained()
+
+
+def test_lease_is_renewed_while_held(tmp_path):
+    path = str(tmp_path / "queue.db")
+    first = ProjectWorkQueue(path, lease_seconds=0.3)
+    second = ProjectWorkQueue(path)
+    first.seed(["p1"])
+
+    assert first.claim("w1") == "p1"
+    with first.lease("p1", "w1"):
+        time.sleep(0.5)
+        assert second.claim("w2") is None
+    assert first.complete("p1", "w1", {})
+
+
+def test_merged_state_in_queue_order(tmp_path):
+    queue = ProjectWorkQueue(str(tmp_path / "queue.db"))
+    queue.seed(["p1", "p2"])
+    for worker_id in ("w1", "w2"):
+        project_id = queue.claim(worker_id)
+        assert not queue.is_drained()
+        queue.complete(project_id, worker_id, {"questions": {"context": {"project_id": project_id}}})
+
+    assert queue.is_drained()
+    assert queue.merged_state() == {
+        "bookmarks": {
+            "questions": {
+                "partitions": [
+                    {"context": {"project_id": "p1"}},
+                    {"context": {"project_id": "p2"}},
+                ]
+            }
+        }
+    }
+
+
+def test_work_queue_sync_writes_one_schema_per_stream(api, tmp_path):
+    api.handler = lambda payload: {
+        "data": {"project": {"teamMembers": [{"id": "m1", "name": "M"}]}}
+    }
+    tap = make_tap(["teamMembers"], work_queue_path=str(tmp_path / "queue.db"))
+
+    messages = sync(tap)
+
+    schemas = [m for m in messages if m["type"] == "SCHEMA" and m["stream"] == "teamMembers"]
+    assert len(schemas) == 1
+    assert [r["project_id"] for r in records(messages, "teamMembers")] == ["p1", "p2"]
+
+
+def test_last_worker_writes_the_merged_state_last(api, tmp_path):
+    path = str(tmp_path / "queue.db")
+    other = ProjectWorkQueue(path)
+    other.seed(["p1", "p2"])
+    assert other.claim("w1") == "p1"
+    other.complete(
+        "p1",
+        "w1",
+        {"teamMembers": {"context": {"project_id": "p1"}, "sync_stats": {"pages": 1}}},
+    )
+    api.handler = lambda payload: {
+        "data": {"project": {"teamMembers": [{"id": "m1", "name": "M"}]}}
+    }
+
+    messages = sync(make_tap(["teamMembers"], work_queue_path=path, worker_id="w2"))
+
+    assert [r["project_id"] for r in records(messages, "teamMembers")] == ["p2"]
+    assert messages[-1]["type"] == "STATE"
+    assert final_state(messages)["bookmarks"]["teamMembers"]["partitions"] == [
+        {"context": {"project_id": "p1"}, "sync_stats": {"pages": 1}},
+    ]
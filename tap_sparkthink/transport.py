@@ -0,0 +1,109 @@
+"""Asyncio HTTP/2 transport for sparkthink GraphQL requests."""
+
+import asyncio
+import threading
+from typing import Any, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Connection-specific headers set by `requests` that HTTP/2 does not allow.
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "content-length",
+    "keep-alive",
+    "proxy-connection",
+    "te",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+class HTTP2Transport:
+    """Send prepared requests over a few multiplexed HTTP/2 connections.
+
+    An asyncio event loop running in a background thread owns a single
+    `httpx.AsyncClient`. Callers on any thread hand it a
+    `requests.PreparedRequest` and block on the result, so concurrent requests
+    from all streams share the same connections instead of one socket each.
+    Responses are converted back to `requests.Response` objects, so streams keep
+    their parsing, pagination and validation unchanged.
+    """
+
+    def __init__(self, max_connections: int = 4) -> None:
+        try:
+            import httpx
+        except ImportError as ex:
+            raise RuntimeError(
+                "The 'http2' transport requires httpx with HTTP/2 support, "
+                "install it with: pip install 'tap-sparkthink[http2]'"
+            ) from ex
+
+        self._httpx = httpx
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="sparkthink-http2", daemon=True
+        )
+        self._thread.start()
+        self._client = self._run(self._create_client(max_connections))
+
+    async def _create_client(self, max_connections: int) -> Any:
+        return self._httpx.AsyncClient(
+            http2=True,
+            limits=self._httpx.Limits(max_connections=max_connections),
+        )
+
+    def _run(self, coroutine: Any) -> Any:
+        """Run `coroutine` on the transport loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def send(
+        self, prepared_request: requests.PreparedRequest, timeout: Optional[float] = None
+    ) -> requests.Response:
+        """Send `prepared_request` and return the response as a `requests.Response`.
+
+        Raises:
+            requests.exceptions.ReadTimeout: When the request times out.
+            requests.exceptions.ConnectionError: On any other transport failure.
+        """
+        httpx = self._httpx
+        try:
+            return self._run(self._send(prepared_request, timeout))
+        except httpx.TimeoutException as ex:
+            raise requests.exceptions.ReadTimeout(str(ex)) from ex
+        except httpx.TransportError as ex:
+            raise requests.exceptions.ConnectionError(str(ex)) from ex
+
+    async def _send(
+        self, prepared_request: requests.PreparedRequest, timeout: Optional[float]
+    ) -> requests.Response:
+        headers = {
+            key: value
+            for key, value in prepared_request.headers.items()
+            if key.lower() not in HOP_BY_HOP_HEADERS
+        }
+        response = await self._client.request(
+            prepared_request.method,
+            prepared_request.url,
+            headers=headers,
+            content=prepared_request.body,
+            timeout=timeout,
+        )
+
+        converted = requests.Response()
+        converted.status_code = response.status_code
+        converted.headers = CaseInsensitiveDict(response.headers)
+        converted._content = response.content
+        converted.encoding = response.encoding
+        converted.reason = response.reason_phrase
+        converted.url = str(response.url)
+        converted.elapsed = response.elapsed
+        converted.request = prepared_request
+        return converted
+
+    def close(self) -> None:
+        """Close the client and stop the event loop thread."""
+        self._run(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
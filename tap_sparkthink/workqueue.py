@@ -0,0 +1,165 @@
+"""Local SQLite work queue for distributing projects across tap processes."""
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+class ProjectWorkQueue:
+    """Queue of project IDs shared by several tap workers on one host.
+
+    Workers claim a project with a lease, sync it and store the resulting
+    per-project state. Expired leases (e.g. of a crashed worker) are handed out
+    again, and the stored states can be merged into a single Singer state once
+    every project is done.
+    """
+
+    def __init__(self, path: str, lease_seconds: int = 3600) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS projects (
+                project_id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker_id TEXT,
+                lease_expires REAL,
+                state TEXT
+            )
+            """
+        )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in a write transaction, serialized across workers."""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def seed(self, project_ids: List[str]) -> bool:
+        """Queue any projects not queued yet.
+
+        Returns:
+            True if this call created the queue, i.e. it was empty before.
+        """
+        with self._transaction() as connection:
+            (queued,) = connection.execute("SELECT COUNT(*) FROM projects").fetchone()
+            connection.executemany(
+                "INSERT OR IGNORE INTO projects (project_id, position) VALUES (?, ?)",
+                [(project_id, position) for position, project_id in enumerate(project_ids)],
+            )
+        return queued == 0
+
+    def claim(self, worker_id: str) -> Optional[str]:
+        """Lease the next pending (or abandoned) project to `worker_id`."""
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                """
+                SELECT project_id FROM projects
+                WHERE status = 'pending'
+                   OR (status = 'claimed' AND lease_expires < ?)
+                ORDER BY position
+                LIMIT 1
+                """,
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                """
+                UPDATE projects
+                SET status = 'claimed', worker_id = ?, lease_expires = ?
+                WHERE project_id = ?
+                """,
+                (worker_id, now + self.lease_seconds, row[0]),
+            )
+        return row[0]
+
+    def renew(self, project_id: str, worker_id: str) -> None:
+        """Extend the lease `worker_id` holds on `project_id`."""
+        with self._transaction() as connection:
+            connection.execute(
+                """
+                UPDATE projects SET lease_expires = ?
+                WHERE project_id = ? AND worker_id = ? AND status = 'claimed'
+                """,
+                (time.time() + self.lease_seconds, project_id, worker_id),
+            )
+
+    @contextmanager
+    def lease(self, project_id: str, worker_id: str) -> Iterator[None]:
+        """Keep renewing the lease `worker_id` holds on `project_id` while in the block.
+
+        A background thread renews the lease every third of `lease_seconds`, so a
+        project whose streams take longer than the lease is not handed out again.
+        """
+        stopped = threading.Event()
+
+        def heartbeat() -> None:
+            # SQLite connections can't be shared across threads, use another one
+            queue = ProjectWorkQueue(self.path, self.lease_seconds)
+            try:
+                while not stopped.wait(self.lease_seconds / 3):
+                    queue.renew(project_id, worker_id)
+            finally:
+                queue.close()
+
+        thread = threading.Thread(target=heartbeat, name="sparkthink-lease", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def complete(self, project_id: str, worker_id: str, state: Dict[str, dict]) -> bool:
+        """Mark `project_id` done, storing its per-stream partition states.
+
+        Returns:
+            False if `worker_id` no longer held the lease, i.e. the project was
+            handed out to another worker that completes it instead.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                """
+                UPDATE projects
+                SET status = 'done', lease_expires = NULL, state = ?
+                WHERE project_id = ? AND worker_id = ? AND status = 'claimed'
+                """,
+                (json.dumps(state), project_id, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def is_drained(self) -> bool:
+        """Return True once every queued project is done."""
+        (remaining,) = self._connection.execute(
+            "SELECT COUNT(*) FROM projects WHERE status != 'done'"
+        ).fetchone()
+        return remaining == 0
+
+    def merged_state(self) -> dict:
+        """Merge the stored per-project states into one Singer state."""
+        bookmarks: Dict[str, dict] = {}
+        rows = self._connection.execute(
+            "SELECT state FROM projects WHERE state IS NOT NULL ORDER BY position"
+        )
+        for (state,) in rows:
+            for stream_name, partition_state in json.loads(state).items():
+                bookmarks.setdefault(stream_name, {"partitions": []})
+                bookmarks[stream_name]["partitions"].append(partition_state)
+        return {"bookmarks": bookmarks}
+
+    def close(self) -> None:
+        """Close the connection to the queue file."""
+        self._connection.close()